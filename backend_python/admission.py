@@ -0,0 +1,182 @@
+"""
+Admission Control - Giới hạn concurrency, độ dài hàng đợi và deadline cho từng endpoint inference
+"""
+import math
+import threading
+import time
+from collections import deque
+
+# Priority của job Whisper: số nhỏ hơn chạy trước
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+
+class Overloaded(Exception):
+    """Request bị từ chối hoặc bị shed, trả về 503 với Retry-After"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Overloaded):
+    """Job Whisper quá deadline trước khi được chạy"""
+
+
+class Ticket:
+    """One request waiting for or holding a slot of an AdmissionGate"""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.state = 'waiting'
+        self.started_at = None
+
+    def remaining(self):
+        """Seconds left before the deadline, None when there is none"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+
+class AdmissionGate:
+    """Concurrency limit plus a bounded, deadline-aware wait queue for one endpoint.
+
+    At most ``max_concurrent`` requests run at once and at most ``max_queue``
+    wait for a slot, in arrival order. A waiter that is still queued at its
+    deadline is shed. When the queue is full, expired waiters are dropped
+    first; then a gate with ``shed_oldest`` (real-time chunks, where the
+    newest audio matters most) drops its oldest waiter, counted apart as
+    ``displaced``, while other gates reject the new request.
+    ``max_concurrent <= 0`` disables the gate.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue, deadline=None, shed_oldest=False):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.shed_oldest = shed_oldest
+
+        self.condition = threading.Condition()
+        self.waiting = deque()
+        self.active = 0
+
+        # Metrics
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.displaced = 0
+        self.avg_service_time = None
+
+    def retry_after(self):
+        """Seconds until a slot is likely free, từ thời gian xử lý trung bình"""
+        if not self.avg_service_time or self.max_concurrent <= 0:
+            return 1
+        return max(1, math.ceil(self.avg_service_time * (len(self.waiting) + 1) / self.max_concurrent))
+
+    def drop_expired(self, now):
+        """Shed waiters whose deadline has passed (caller holds the lock)"""
+        expired = [ticket for ticket in self.waiting if ticket.deadline is not None and ticket.deadline <= now]
+        for ticket in expired:
+            self.waiting.remove(ticket)
+            ticket.state = 'shed'
+        if expired:
+            self.condition.notify_all()
+
+    def admit(self, ticket):
+        ticket.state = 'admitted'
+        ticket.started_at = time.monotonic()
+        self.active += 1
+        self.admitted += 1
+
+    def has_room(self, pending=0):
+        """Whether a request arriving now would be let in, with ``pending`` others not yet at the gate.
+
+        Lets a server turn a request away before buffering its upload. A
+        ``shed_oldest`` gate can always drop a waiter, so only the requests
+        still uploading count against its capacity.
+        """
+        if self.max_concurrent <= 0:
+            return True
+        capacity = self.max_concurrent + self.max_queue
+        if self.shed_oldest:
+            return pending < capacity
+        with self.condition:
+            return self.active + len(self.waiting) + pending < capacity
+
+    def acquire(self):
+        """Wait for a slot and return its Ticket, raise Overloaded when rejected or shed"""
+        now = time.monotonic()
+        ticket = Ticket(now + self.deadline if self.deadline else None)
+        if self.max_concurrent <= 0:
+            ticket.state = 'admitted'
+            return ticket
+
+        with self.condition:
+            if self.active < self.max_concurrent and not self.waiting:
+                self.admit(ticket)
+                return ticket
+
+            self.drop_expired(now)
+            if len(self.waiting) >= self.max_queue:
+                if not (self.shed_oldest and self.waiting):
+                    self.rejected += 1
+                    raise Overloaded(f"Endpoint '{self.name}' is overloaded", self.retry_after())
+                oldest = self.waiting.popleft()
+                oldest.state = 'displaced'
+                self.condition.notify_all()
+            self.waiting.append(ticket)
+
+            while ticket.state == 'waiting':
+                remaining = ticket.remaining()
+                if remaining == 0.0:
+                    self.waiting.remove(ticket)
+                    ticket.state = 'shed'
+                    break
+                self.condition.wait(remaining)
+
+            if ticket.state == 'displaced':
+                self.displaced += 1
+                raise Overloaded(f"Request to '{self.name}' was dropped for a newer one while the queue was full",
+                                 self.retry_after())
+            if ticket.state != 'admitted':
+                self.shed += 1
+                raise Overloaded(f"Request to '{self.name}' was shed after waiting too long", self.retry_after())
+            return ticket
+
+    def release(self, ticket):
+        """Free the slot of an admitted ticket and hand it to the next live waiter"""
+        if self.max_concurrent <= 0:
+            return
+        with self.condition:
+            self.active -= 1
+            elapsed = time.monotonic() - ticket.started_at
+            self.avg_service_time = elapsed if self.avg_service_time is None else \
+                0.8 * self.avg_service_time + 0.2 * elapsed
+
+            now = time.monotonic()
+            self.drop_expired(now)
+            if self.waiting and self.active < self.max_concurrent:
+                self.admit(self.waiting.popleft())
+                self.condition.notify_all()
+
+    def reject(self):
+        """Overloaded error for a request turned away before reaching acquire()"""
+        with self.condition:
+            self.rejected += 1
+        return Overloaded(f"Endpoint '{self.name}' is overloaded", self.retry_after())
+
+    def stats(self):
+        with self.condition:
+            return {
+                'active': self.active,
+                'waiting': len(self.waiting),
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'deadline': self.deadline,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'shed': self.shed,
+                'displaced': self.displaced,
+                'avg_service_time': round(self.avg_service_time, 4) if self.avg_service_time else None
+            }
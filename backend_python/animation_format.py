@@ -0,0 +1,191 @@
+"""
+Animation Format - Keyframes dạng cột (typed arrays) thay vì list dict cho từng frame
+"""
+import base64
+
+import numpy as np
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+# Các channel float của keyframe, ship dưới dạng Float32
+FLOAT_CHANNELS = ('mouth_open', 'mouth_width', 'lip_round', 'jaw_open')
+ENCODINGS = ('json', 'base64', 'msgpack')
+
+
+def lookup_table(values):
+    """Return (table, ids): unique values in first-seen order and each value's index"""
+    table = []
+    positions = {}
+    ids = []
+    for value in values:
+        if value not in positions:
+            positions[value] = len(table)
+            table.append(value)
+        ids.append(positions[value])
+    dtype = np.uint8 if len(table) <= 256 else np.dtype('<u2')
+    return table, np.array(ids, dtype=dtype)
+
+
+def columnar_keyframes(arrays, visemes):
+    """Turn VisemeMapper.keyframe_arrays output into parallel per-channel arrays.
+
+    Row ``i`` is frame ``start_frame + i``, at time ``(start_frame + i) / fps``.
+    ``viseme_id``/``phoneme_id`` index into
+    ``viseme_table``/``phoneme_table``; frames outside every viseme use 'rest'.
+    """
+    index = arrays['viseme_index']
+    # Index -1 (frame không thuộc viseme nào) trỏ vào phần tử rest thêm ở cuối
+    viseme_table, viseme_ids = lookup_table([v.get('viseme', 'rest') for v in visemes] + ['rest'])
+    phoneme_table, phoneme_ids = lookup_table([v.get('phoneme', '') for v in visemes] + [''])
+
+    columns = {name: arrays[name].astype('<f4') for name in FLOAT_CHANNELS}
+    columns['blink'] = arrays['blink'].astype(np.uint8)
+    columns['viseme_id'] = viseme_ids[index]
+    columns['phoneme_id'] = phoneme_ids[index]
+
+    return {
+        'total_frames': len(index),
+        'start_frame': int(arrays['frame'][0]) if len(index) else 0,
+        'columns': columns,
+        'viseme_table': viseme_table,
+        'phoneme_table': phoneme_table
+    }
+
+
+def encode_column(values, encoding):
+    """Encode one column: plain list for json, little-endian bytes otherwise"""
+    if encoding == 'json':
+        if values.dtype.kind == 'f':
+            return np.round(values.astype(np.float64), 4).tolist()
+        return values.tolist()
+
+    data = values.tobytes()
+    return {
+        'dtype': values.dtype.name,
+        'length': len(values),
+        'data': base64.b64encode(data).decode('ascii') if encoding == 'base64' else data
+    }
+
+
+def encode_columnar(columnar, encoding='json'):
+    """Encode columnar keyframes for the response.
+
+    ``json`` gives plain number lists, ``base64`` gives little-endian typed
+    array bytes as base64 strings (load with ``new Float32Array(buffer)``) and
+    ``msgpack`` keeps the raw bytes for a binary msgpack body.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of {list(ENCODINGS)}")
+    if encoding == 'msgpack' and not MSGPACK_AVAILABLE:
+        raise ValueError("msgpack encoding requires the msgpack package")
+
+    columns = {}
+    for name, values in columnar['columns'].items():
+        if isinstance(values, dict):
+            # Channel đã simplify: knots hoặc runs
+            columns[name] = {part: encode_column(array, encoding) for part, array in values.items()}
+        else:
+            columns[name] = encode_column(values, encoding)
+
+    encoded = {
+        'format': 'columnar',
+        'encoding': encoding,
+        'total_frames': columnar['total_frames'],
+        'start_frame': columnar.get('start_frame', 0),
+        'viseme_table': columnar['viseme_table'],
+        'phoneme_table': columnar['phoneme_table'],
+        'columns': columns
+    }
+    if 'reduction' in columnar:
+        encoded['reduction'] = columnar['reduction']
+    return encoded
+
+
+def pack_msgpack(payload):
+    """Serialize a response dict (with raw bytes columns) to msgpack"""
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def simplify_curve(values, tolerance):
+    """Indices of the knots of a piecewise-linear fit within ``tolerance``.
+
+    Ramer-Douglas-Peucker over (frame, value): the curve rebuilt with
+    ``np.interp`` at every frame stays within ``tolerance`` of ``values``.
+    """
+    count = len(values)
+    if count <= 2:
+        return np.arange(count)
+
+    values = values.astype(np.float64)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        frames = np.arange(first + 1, last)
+        line = values[first] + (values[last] - values[first]) * (frames - first) / (last - first)
+        errors = np.abs(values[first + 1:last] - line)
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def run_starts(values):
+    """Start index of every run of equal values"""
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(([0], np.flatnonzero(np.diff(values)) + 1))
+
+
+def simplify_columnar(columnar, tolerance=0.01):
+    """Reduce columnar keyframes to the points needed to rebuild each channel.
+
+    Float channels become piecewise-linear knots (``frames``/``values``, rebuild
+    with linear interpolation); blink and id channels become run-length runs
+    (``starts``/``values``, each value holds until the next start). The
+    ``reduction`` block reports points and raw bytes before and after. Knot
+    frames and run starts are relative to ``start_frame``.
+    """
+    index_dtype = np.dtype('<u2') if columnar['total_frames'] <= 0xFFFF else np.dtype('<u4')
+    columns = {}
+    channel_stats = {}
+    bytes_before = 0
+    bytes_after = 0
+    for name, values in columnar['columns'].items():
+        if name in FLOAT_CHANNELS:
+            indices = simplify_curve(values, tolerance)
+            columns[name] = {'frames': indices.astype(index_dtype), 'values': values[indices]}
+        else:
+            indices = run_starts(values)
+            columns[name] = {'starts': indices.astype(index_dtype), 'values': values[indices]}
+
+        size = sum(part.nbytes for part in columns[name].values())
+        bytes_before += values.nbytes
+        bytes_after += size
+        channel_stats[name] = {'points_before': len(values), 'points_after': len(indices)}
+
+    return {
+        'total_frames': columnar['total_frames'],
+        'start_frame': columnar.get('start_frame', 0),
+        'columns': columns,
+        'viseme_table': columnar['viseme_table'],
+        'phoneme_table': columnar['phoneme_table'],
+        'reduction': {
+            'tolerance': tolerance,
+            'bytes_before': bytes_before,
+            'bytes_after': bytes_after,
+            'ratio': round(bytes_after / bytes_before, 4) if bytes_before else 1.0,
+            'channels': channel_stats
+        }
+    }
@@ -1,57 +1,194 @@
-from flask import Flask, request, jsonify, render_template, abort
+from flask import Flask, Request, request, jsonify, render_template, abort, Response, g
 from flask_cors import CORS
-from faster_whisper import WhisperModel
+from flask_socketio import SocketIO
+import io
 import os
-import tempfile
-import uuid
+import json
+import math
+import functools
 from werkzeug.utils import secure_filename
 import time
-from g2p_en import G2p
+import threading
 from viseme_system import VisemeMapper
+from arpabet_ipa import arpabet_to_ipa, arpabet_to_ipa_batch
+from audio_io import decode_upload, decode_audio_bytes, SAMPLE_RATE
+from streaming import StreamingSession
+from model_pool import ModelWorkerPool, fork_available
+from component_loader import ComponentLoader
+from result_cache import ResultCache, audio_key, text_key
+from precompute_store import PrecomputeStore
+from animation_format import encode_columnar, simplify_columnar, pack_msgpack, ENCODINGS, MSGPACK_AVAILABLE
+from metrics import Metrics
+from pronunciation_scoring import PronunciationScorer
+from admission import AdmissionGate, Overloaded, PRIORITY_BULK
+from long_audio import transcribe_long
+
+class InMemoryRequest(Request):
+    """Flask request that keeps multipart uploads in memory.
+
+    Werkzeug spools uploads larger than 500KB to a temporary file; uploads are
+    already bounded by MAX_CONTENT_LENGTH so they can stay in a BytesIO.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
 
 app = Flask(__name__)
+# Histogram latency theo stage/endpoint cho /metrics
+metrics = Metrics()
+# Giữ file upload trong memory thay vì spool ra file tạm
+app.request_class = InMemoryRequest
 
 # Configure CORS to allow requests from the frontend
-CORS(app, origins=["http://localhost:3000", "http://127.0.0.1:3000", "http://localhost:5173", "http://127.0.0.1:5173"])
+CORS_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000", "http://localhost:5173", "http://127.0.0.1:5173"]
+CORS(app, origins=CORS_ORIGINS)
+
+# Socket.IO cho real-time streaming transcription
+SOCKETIO_ORIGINS = CORS_ORIGINS + ["http://localhost:5000", "http://127.0.0.1:5000"]
+socketio = SocketIO(app, cors_allowed_origins=SOCKETIO_ORIGINS)
 
 # Cấu hình
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'm4a', 'ogg', 'flac', 'aac'}
+G2P_CACHE_SIZE = int(os.environ.get('G2P_CACHE_SIZE', 50000))
+WHISPER_MODEL_SIZE = os.environ.get('WHISPER_MODEL_SIZE', 'base')  # tiny, base, small, medium, large
+WHISPER_DEVICE = os.environ.get('WHISPER_DEVICE', 'cpu')
+WHISPER_COMPUTE_TYPE = os.environ.get('WHISPER_COMPUTE_TYPE', 'int8')
+WHISPER_POOL_SIZE = int(os.environ.get('WHISPER_POOL_SIZE', 1))
+WHISPER_CPU_THREADS = int(os.environ.get('WHISPER_CPU_THREADS', 0))  # 0 = chia đều số core cho các worker
+WHISPER_BATCH_SIZE = int(os.environ.get('WHISPER_BATCH_SIZE', 8))
+WHISPER_BATCH_WAIT_MS = float(os.environ.get('WHISPER_BATCH_WAIT_MS', 50))
+# Ngôn ngữ mặc định cho Whisper (ví dụ 'en'); rỗng = detect cho từng audio
+WHISPER_LANGUAGE = os.environ.get('WHISPER_LANGUAGE', '') or None
+G2P_POOL_WORKERS = int(os.environ.get('G2P_POOL_WORKERS', 0))  # 0 = tắt, batch G2P chạy inline
+MAX_IPA_BATCH_SIZE = 1000
+MAX_SCORING_BATCH_SIZE = 1000
+BLEND_LOOKAHEAD = 0.04  # Miệng chuẩn bị cho âm kế tiếp sớm 40ms khi blend
+STREAM_BATCH_FRAMES = 300  # Số keyframe mỗi dòng NDJSON khi stream animation
+G2P_LEXICON_PATH = os.environ.get('G2P_LEXICON_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicon.txt'))
+TRANSCRIBE_BEAM_SIZE = 5
+# Audio dài hơn ngưỡng này được cắt tại khoảng lặng và transcribe các đoạn song song
+LONG_AUDIO_MIN_DURATION = float(os.environ.get('LONG_AUDIO_MIN_DURATION', 60))
+LONG_AUDIO_PIECE_MIN = float(os.environ.get('LONG_AUDIO_PIECE_MIN', 15))
+LONG_AUDIO_PIECE_MAX = float(os.environ.get('LONG_AUDIO_PIECE_MAX', 28))
+# Admission control cho endpoint Whisper: số request chạy cùng lúc, số request chờ, deadline (giây)
+TRANSCRIBE_MAX_CONCURRENT = int(os.environ.get('TRANSCRIBE_MAX_CONCURRENT', 4))
+TRANSCRIBE_MAX_QUEUE = int(os.environ.get('TRANSCRIBE_MAX_QUEUE', 16))
+TRANSCRIBE_DEADLINE = float(os.environ.get('TRANSCRIBE_DEADLINE', 60))
+CHUNK_MAX_CONCURRENT = int(os.environ.get('CHUNK_MAX_CONCURRENT', 8))
+CHUNK_MAX_QUEUE = int(os.environ.get('CHUNK_MAX_QUEUE', 32))
+CHUNK_DEADLINE = float(os.environ.get('CHUNK_DEADLINE', 2.0))  # Chunk real-time cũ hơn thế này không còn giá trị
+TRANSCRIPTION_CACHE_SIZE = int(os.environ.get('TRANSCRIPTION_CACHE_SIZE', 256))
+TRANSCRIPTION_CACHE_DIR = os.environ.get('TRANSCRIPTION_CACHE_DIR', '')  # rỗng = chỉ cache trong memory
+ANIMATION_CACHE_SIZE = int(os.environ.get('ANIMATION_CACHE_SIZE', 1024))
+# SQLite store do precompute_store.py build sẵn từ corpus câu bài học
+PRECOMPUTE_STORE_PATH = os.environ.get('PRECOMPUTE_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'precomputed.db'))
+# Thời gian tối đa một request text chờ G2P load xong lúc khởi động
+G2P_LOAD_TIMEOUT = float(os.environ.get('G2P_LOAD_TIMEOUT', 30))
 
-# Load Faster Whisper model - nhanh hơn nhiều so với whisper thường
-print("Loading Faster Whisper model...")
-# Sử dụng CPU hoặc GPU
-model_size = "base"  # tiny, base, small, medium, large
-model = WhisperModel(model_size, device="cpu", compute_type="int8")
-print(f"Faster Whisper {model_size} model loaded successfully!")
+# Faster Whisper - nhanh hơn nhiều so với whisper thường
+model_size = WHISPER_MODEL_SIZE
+if WHISPER_POOL_SIZE > 1 and not fork_available():
+    print("Whisper worker pool needs fork, falling back to a single in-process model")
+    WHISPER_POOL_SIZE = 1
 
-# Load G2P models for IPA conversion
-print("Loading G2P models for IPA conversion...")
-try:
+whisper_pool = None
+if WHISPER_POOL_SIZE > 1:
+    # Fork các worker trước khi start bất kỳ thread nào trong process chính
+    print(f"Starting {WHISPER_POOL_SIZE} Faster Whisper {model_size} workers...")
+    whisper_pool = ModelWorkerPool(
+        WHISPER_POOL_SIZE,
+        model_size,
+        device=WHISPER_DEVICE,
+        compute_type=WHISPER_COMPUTE_TYPE,
+        cpu_threads=WHISPER_CPU_THREADS,
+        batch_size=WHISPER_BATCH_SIZE,
+        max_wait=WHISPER_BATCH_WAIT_MS / 1000,
+        default_language=WHISPER_LANGUAGE
+    )
+
+# Process pool cho batch G2P (opt-in): fork sau Whisper worker vì create_pool start thread của executor
+g2p_pool = None
+if G2P_POOL_WORKERS > 1 and fork_available():
+    from g2p_cache import create_pool
+    print(f"Starting G2P process pool with {G2P_POOL_WORKERS} workers...")
+    g2p_pool = create_pool(G2P_POOL_WORKERS)
+
+# Mọi process đã fork xong, giờ mới start receiver thread của Whisper pool
+if whisper_pool is not None:
+    whisper_pool.start()
+
+def load_whisper():
+    """Load Faster Whisper model, trả về scheduler mà mọi request Whisper đi qua"""
+    if whisper_pool is not None:
+        return whisper_pool.wait_ready()
+    
+    from faster_whisper import WhisperModel
+    from inference_scheduler import BatchScheduler
+    
+    print("Loading Faster Whisper model...")
+    model = WhisperModel(model_size, device=WHISPER_DEVICE, compute_type=WHISPER_COMPUTE_TYPE,
+                         cpu_threads=WHISPER_CPU_THREADS)
+    print(f"Faster Whisper {model_size} model loaded successfully!")
+    
+    # Mọi request Whisper đi qua scheduler để gom thành batch
+    return BatchScheduler(model, max_batch_size=WHISPER_BATCH_SIZE, max_wait=WHISPER_BATCH_WAIT_MS / 1000,
+                          default_language=WHISPER_LANGUAGE)
+
+def load_g2p():
+    """Load G2P model for IPA conversion, wrapped in the word-level cache"""
+    from g2p_en import G2p
+    from g2p_cache import G2PCache
+    
+    print("Loading G2P models for IPA conversion...")
     g2p = G2p()  # English G2P model
     print("G2P-EN model loaded successfully!")
-    G2P_AVAILABLE = True
-except Exception as e:
-    print(f"Error loading G2P model: {e}")
-    g2p = None
-    G2P_AVAILABLE = False
+    
+    # Word-level cache để chỉ các từ OOV mới phải chạy neural G2P
+    cache = G2PCache(g2p, arpabet_to_ipa, max_size=G2P_CACHE_SIZE, stage_timer=metrics.stage,
+                     ipa_batch_converter=arpabet_to_ipa_batch)
+    if os.path.exists(G2P_LEXICON_PATH):
+        try:
+            lexicon_words = cache.load_lexicon(G2P_LEXICON_PATH)
+            print(f"Loaded {lexicon_words} words from G2P lexicon {G2P_LEXICON_PATH}")
+        except Exception as e:
+            print(f"Error loading G2P lexicon: {e}")
+    return cache
+
+# Load các model trong background để app phục vụ ngay, /health báo trạng thái từng phần
+whisper_loader = ComponentLoader('whisper', load_whisper).start()
+g2p_loader = ComponentLoader('g2p', load_g2p).start()
+# Viseme Mapper for facial animation
+viseme_loader = ComponentLoader('viseme', lambda: VisemeMapper(stage_timer=metrics.stage)).start()
+
+# Cache kết quả /transcribe theo hash nội dung audio
+transcription_cache = ResultCache(TRANSCRIPTION_CACHE_SIZE, TRANSCRIPTION_CACHE_DIR)
+# Cache animation theo (ipa_text, duration, fps, format, seed), chỉ trong memory
+animation_cache = ResultCache(ANIMATION_CACHE_SIZE)
+
+# Live chunk bị shed từ cái cũ nhất khi hàng đợi đầy, upload /transcribe thì từ chối request mới
+admission_gates = {
+    'transcribe': AdmissionGate('transcribe', TRANSCRIBE_MAX_CONCURRENT, TRANSCRIBE_MAX_QUEUE, TRANSCRIBE_DEADLINE),
+    'transcribe_chunk': AdmissionGate('transcribe_chunk', CHUNK_MAX_CONCURRENT, CHUNK_MAX_QUEUE, CHUNK_DEADLINE,
+                                      shed_oldest=True)
+}
+
+# Chấm phát âm: chỉ là bảng cost + tokenizer, tạo ngay khi start
+pronunciation_scorer = PronunciationScorer()
+
+precompute_store = None
+if os.path.exists(PRECOMPUTE_STORE_PATH):
+    try:
+        precompute_store = PrecomputeStore(PRECOMPUTE_STORE_PATH)
+        print(f"Loaded precomputed store {PRECOMPUTE_STORE_PATH}: {precompute_store.counts()}")
+    except Exception as e:
+        print(f"Error opening precomputed store: {e}")
 
 # Skip epitran for now due to encoding issues
 EPITRAN_AVAILABLE = False
 epitran_eng = None
 print("Epitran disabled due to compatibility issues, using G2P-EN only")
 
-# Initialize Viseme Mapper for facial animation
-print("Loading Viseme Mapper for facial animation...")
-try:
-    viseme_mapper = VisemeMapper()
-    VISEME_AVAILABLE = True
-    print("Viseme Mapper loaded successfully!")
-except Exception as e:
-    print(f"Error loading Viseme Mapper: {e}")
-    viseme_mapper = None
-    VISEME_AVAILABLE = False
-
 # Initialize Real Face Animator for realistic facial animation
 print("Loading Real Face Animator for realistic facial animation...")
 try:
@@ -72,86 +209,71 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def arpabet_to_ipa(arpabet_symbols):
-    """Chuyển đổi ARPAbet symbols sang IPA với trọng âm"""
-    # Mapping ARPAbet base to IPA (không có stress numbers)
-    arpabet_to_ipa_map = {
-        # Vowels
-        'AA': 'ɑː', 'AE': 'æ', 'AH': 'ʌ', 'AO': 'ɔ:', 'AW': 'aʊ', 'AY': 'aɪ',
-        'EH': 'ɛ', 'ER': 'ɜː', 'EY': 'eɪ', 'IH': 'ɪ', 'IY': 'i:', 'OW': 'oʊ',
-        'OY': 'ɔɪ', 'UH': 'ʊ', 'UW': 'u:',
-        
-        # Consonants
-        'B': 'b', 'CH': 'tʃ', 'D': 'd', 'DH': 'ð', 'F': 'f',
-        'G': 'ɡ', 'HH': 'h', 'JH': 'dʒ', 'K': 'k', 'L': 'l',
-        'M': 'm', 'N': 'n', 'NG': 'ŋ', 'P': 'p', 'R': 'r',
-        'S': 's', 'SH': 'ʃ', 'T': 't', 'TH': 'θ', 'V': 'v',
-        'W': 'w', 'Y': 'j', 'Z': 'z', 'ZH': 'ʒ'
-    }
-    
-    ipa_symbols = []
-    i = 0
-    
-    while i < len(arpabet_symbols):
-        symbol = arpabet_symbols[i]
-        
-        # Handle spaces and word boundaries
-        if symbol == ' ':
-            ipa_symbols.append(' ')
-            i += 1
-            continue
-        
-        # Extract base phoneme and stress level
-        base_phoneme = symbol
-        stress_level = ''
-        
-        # Check if symbol has stress marker (0, 1, 2)
-        if len(symbol) > 1 and symbol[-1].isdigit():
-            base_phoneme = symbol[:-1]
-            stress_level = symbol[-1]
-        
-        # Convert base phoneme to IPA
-        if base_phoneme in arpabet_to_ipa_map:
-            ipa_phone = arpabet_to_ipa_map[base_phoneme]
-            
-            # Add stress markers for vowels only
-            if stress_level and base_phoneme in ['AA', 'AE', 'AH', 'AO', 'AW', 'AY', 'EH', 'ER', 'EY', 'IH', 'IY', 'OW', 'OY', 'UH', 'UW']:
-                if stress_level == '1':  # Primary stress
-                    ipa_phone = 'ˈ' + ipa_phone
-                elif stress_level == '2':  # Secondary stress
-                    ipa_phone = 'ˌ' + ipa_phone
-                # stress_level == '0' means no stress (unstressed), no marker needed
-            
-            # Special handling for AH - unstressed AH becomes schwa
-            if base_phoneme == 'AH' and stress_level == '0':
-                ipa_phone = 'ə'
-            elif base_phoneme == 'ER' and stress_level == '0':
-                ipa_phone = 'ɚ'  # unstressed ER
-            
-            ipa_symbols.append(ipa_phone)
-        else:
-            # Fallback for unknown symbols
-            ipa_symbols.append(symbol.lower())
-        
-        i += 1
-    
-    return ''.join(ipa_symbols)
+def component_unavailable(loader):
+    """503 response khi một model chưa load xong hoặc load lỗi"""
+    status = loader.status()
+    response = jsonify({
+        'success': False,
+        'error': f"Component '{loader.name}' is {status['status']}",
+        'component': status
+    })
+    return response, 503, {'Retry-After': '5'}
+
+def overloaded(error):
+    """503 response khi request bị admission control từ chối hoặc shed"""
+    response = jsonify({
+        'success': False,
+        'error': str(error)
+    })
+    return response, 503, {'Retry-After': str(error.retry_after)}
+
+def admission_controlled(gate):
+    """Route decorator: wait for a slot of the gate before touching the upload.
+
+    The slot is held until the response is sent, including NDJSON streams,
+    and the request's remaining deadline is in ``g.admission_ticket``.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                ticket = gate.acquire()
+            except Overloaded as e:
+                return overloaded(e)
+            g.admission_ticket = ticket
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except BaseException:
+                gate.release(ticket)
+                raise
+            if response.is_streamed:
+                response.call_on_close(lambda: gate.release(ticket))
+            else:
+                gate.release(ticket)
+            return response
+        return wrapper
+    return decorator
 
 def text_to_ipa(text):
     """Chuyển đổi text sang IPA sử dụng G2P-EN"""
     try:
+        # Câu bài học đã tính sẵn: một lần đọc theo hash
+        if precompute_store is not None:
+            stored = precompute_store.get_ipa(text)
+            if stored is not None:
+                return stored
+        
         print(f"Converting text to IPA: '{text[:50]}...'")
         result = {'success': True}
         
         # Method 1: Sử dụng G2P-EN (tốt cho English)
-        if G2P_AVAILABLE and g2p is not None:
+        g2p_cache = g2p_loader.get(timeout=G2P_LOAD_TIMEOUT)
+        if g2p_cache is not None:
             try:
-                # G2P works with the entire text
-                g2p_result = g2p(text)
+                # Word cache gives the same ARPAbet as g2p(text) for the entire text
+                with metrics.stage('g2p'):
+                    g2p_result, ipa_result = g2p_cache.convert(text)
                 print(f"G2P ARPAbet result: {g2p_result}")
-                
-                # Convert ARPAbet to IPA
-                ipa_result = arpabet_to_ipa(g2p_result)
                 result['g2p_ipa'] = ipa_result
                 result['arpabet'] = ' '.join(g2p_result)  # Also include ARPAbet for reference
                 print(f"IPA conversion successful: {ipa_result}")
@@ -180,19 +302,165 @@ def text_to_ipa(text):
             'error': str(e)
         }
 
+def texts_to_ipa(texts):
+    """Chuyển đổi nhiều text sang IPA, G2P chạy một lần cho mỗi từ duy nhất"""
+    g2p_cache = g2p_loader.get(timeout=G2P_LOAD_TIMEOUT)
+    if g2p_cache is None:
+        return [text_to_ipa(text) for text in texts], {}
+
+    try:
+        with metrics.stage('g2p'):
+            converted, stats = g2p_cache.convert_batch(texts, pool=g2p_pool)
+    except Exception as e:
+        print(f"Batch G2P conversion error: {e}")
+        return [text_to_ipa(text) for text in texts], {}
+
+    results = []
+    for g2p_result, ipa_result in converted:
+        results.append({
+            'success': True,
+            'g2p_ipa': ipa_result,
+            'arpabet': ' '.join(g2p_result),
+            'epitran_ipa': ipa_result
+        })
+    return results, stats
+
+def scoring_pairs(items):
+    """(expected_ipa, spoken_ipa) cho từng item; field *_text được chuyển sang IPA trong một batch G2P"""
+    texts = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f'Item {index} must be an object')
+        for side in ('expected', 'spoken'):
+            ipa = item.get(f'{side}_ipa')
+            text = item.get(f'{side}_text')
+            if ipa is None and text is None:
+                raise ValueError(f'Item {index} needs {side}_ipa or {side}_text')
+            if not isinstance(ipa if ipa is not None else text, str):
+                raise ValueError(f'Item {index}: {side}_ipa/{side}_text must be a string')
+            if ipa is None:
+                texts.append(text.strip())
+
+    unique_texts = list(dict.fromkeys(texts))
+    converted = dict(zip(unique_texts, texts_to_ipa(unique_texts)[0])) if unique_texts else {}
+
+    pairs = []
+    for item in items:
+        pair = []
+        for side in ('expected', 'spoken'):
+            ipa = item.get(f'{side}_ipa')
+            pair.append(ipa if ipa is not None else converted[item[f'{side}_text'].strip()]['g2p_ipa'])
+        pairs.append(tuple(pair))
+    return pairs
+
+def score_items(items):
+    """Chấm phát âm cho nhiều item, trả về list kết quả theo thứ tự"""
+    pairs = scoring_pairs(items)
+    with metrics.stage('scoring'):
+        scores = pronunciation_scorer.score_batch(pairs)
+    results = []
+    for item, (expected_ipa, spoken_ipa), score in zip(items, pairs, scores):
+        result = {'expected_ipa': expected_ipa, 'spoken_ipa': spoken_ipa, **score}
+        if 'id' in item:
+            result['id'] = item['id']
+        results.append(result)
+    return results
+
+def join_ipa(results):
+    """Ghép kết quả text_to_ipa của các đoạn liên tiếp thành một kết quả"""
+    joined = {'success': all(result.get('success', False) for result in results)}
+    for field in ('g2p_ipa', 'arpabet', 'epitran_ipa'):
+        joined[field] = ' '.join(result[field] for result in results if result.get(field))
+    return joined
+
+def words_to_ipa(segments):
+    """Word-level timestamps của các segment kèm IPA của từng từ"""
+    words = [word for segment in segments for word in (segment.words or [])]
+    texts = [word.word.strip() for word in words]
+    
+    g2p_cache = g2p_loader.get(timeout=G2P_LOAD_TIMEOUT)
+    if g2p_cache is not None:
+        try:
+            # Mỗi từ duy nhất chỉ chạy G2P một lần
+            with metrics.stage('g2p'):
+                converted, _ = g2p_cache.convert_batch(texts)
+            ipa_list = [ipa for _, ipa in converted]
+        except Exception as e:
+            print(f"Word G2P conversion error: {e}")
+            ipa_list = texts
+    else:
+        ipa_list = texts
+    
+    return [{
+        'word': text,
+        'start': round(word.start, 3),
+        'end': round(word.end, 3),
+        'probability': round(word.probability, 4),
+        'ipa': ipa
+    } for word, text, ipa in zip(words, texts, ipa_list)]
+
+def blend_lookahead(params):
+    """Lookahead (giây) cho coarticulation blending, None nếu request không bật blend.
+
+    Raises ValueError with a client-facing message for a non-numeric, negative or non-finite value.
+    """
+    if str(params.get('blend', 'false')).lower() not in ('1', 'true', 'yes'):
+        return None
+    try:
+        lookahead = float(params.get('lookahead', BLEND_LOOKAHEAD))
+    except (TypeError, ValueError):
+        raise ValueError('lookahead must be a number')
+    if not math.isfinite(lookahead) or lookahead < 0:
+        raise ValueError('lookahead must be a finite number >= 0')
+    return lookahead
+
+def segment_dict(segment):
+    """JSON của một Whisper segment"""
+    return {
+        "id": segment.id,
+        "start": segment.start,
+        "end": segment.end,
+        "text": segment.text
+    }
+
+def ndjson(payload):
+    """Một dòng NDJSON"""
+    return json.dumps(payload, ensure_ascii=False) + '\n'
+
+def stream_transcription(filename, segments, finish):
+    """NDJSON lines: 'start', one 'segment' (with IPA) per segment as it is decoded, then 'done'.
+    
+    ``finish`` receives the segment dicts and returns the full /transcribe
+    response, which is sent without its segments as the 'done' line.
+    """
+    try:
+        yield ndjson({'type': 'start', 'filename': filename, 'model': f'faster-whisper-{model_size}'})
+        segment_list = []
+        for segment in segments:
+            segment_list.append(segment)
+            yield ndjson(dict(segment, type='segment', ipa=text_to_ipa(segment['text'].strip())))
+        response = finish(segment_list)
+        yield ndjson(dict({key: value for key, value in response.items() if key != 'segments'}, type='done'))
+    except Exception as e:
+        yield ndjson({'type': 'error', 'success': False, 'error': str(e)})
+
 @app.route('/')
 def index():
     """Endpoint chính"""
     return render_template('faster_whisper.html')
 
 @app.route('/transcribe', methods=['POST'])
+@admission_controlled(admission_gates['transcribe'])
 def transcribe_audio():
     """Endpoint để upload file audio và trả về kết quả transcription nhanh"""
     try:
-        if 'file' not in request.files:
+        # Multipart body được parse ở lần truy cập request.files đầu tiên
+        with metrics.stage('upload'):
+            files = request.files
+        if 'file' not in files:
             return jsonify({'error': 'No file part'}), 400
         
-        file = request.files['file']
+        file = files['file']
         
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
@@ -201,60 +469,180 @@ def transcribe_audio():
             return jsonify({
                 'error': 'File format not supported',
                 'supported_formats': list(ALLOWED_EXTENSIONS)
-            }), 400        # Đo thời gian xử lý
+            }), 400
+        
+        # align=true: word timestamps + viseme track căn theo thời gian thực của từng từ
+        align = request.form.get('align', 'false').lower() in ('1', 'true', 'yes')
+        fps = None
+        if align:
+            try:
+                fps = int(request.form.get('fps', 30))
+            except ValueError:
+                return jsonify({'error': 'fps must be an integer'}), 400
+            if fps <= 0:
+                return jsonify({'error': 'fps must be > 0'}), 400
+        # blend=true: coarticulation blending giữa các viseme liền kề
+        try:
+            lookahead = blend_lookahead(request.form)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # stream=true: trả NDJSON, mỗi segment một dòng ngay khi decode xong
+        stream = request.form.get('stream', 'false').lower() in ('1', 'true', 'yes')
+        if align and stream:
+            return jsonify({'error': 'align and stream cannot be combined'}), 400
+        # long=auto: audio từ LONG_AUDIO_MIN_DURATION trở lên đi long-audio mode (không áp dụng cho stream)
+        long_mode = request.form.get('long', 'auto').lower()
+        filename = secure_filename(file.filename)
+        
+        # Đo thời gian xử lý
         start_time = time.time()
         
-        # Tạo tên file tạm với UUID
-        file_extension = os.path.splitext(file.filename)[1]
-        uid = str(uuid.uuid4()) + file_extension
-        temp_file_path = os.path.join(tempfile.gettempdir(), uid)
+        # Cùng nội dung audio + cùng model/beam_size thì trả lại kết quả cũ
+        data = file.read()
+        # Stream luôn decode cả file một job, nên cache riêng với kết quả long-audio chia piece
+        cache_key = audio_key(data, model_size, TRANSCRIBE_BEAM_SIZE, *(('align', fps, lookahead) if align else ()),
+                              *(('stream',) if stream else ('long', long_mode) if long_mode != 'auto' else ()))
+        cached = transcription_cache.get(cache_key)
+        if cached is not None:
+            processing_time = time.time() - start_time
+            print(f"Transcription cache hit for {file.filename}")
+            if stream:
+                finish = lambda segment_list: dict(cached, filename=filename,
+                                                   processing_time=round(time.time() - start_time, 3), cached=True)
+                return Response(stream_transcription(filename, cached['segments'], finish),
+                                mimetype='application/x-ndjson')
+            return jsonify(dict(
+                cached,
+                filename=filename,
+                processing_time=round(processing_time, 3),
+                cached=True
+            ))
         
-        # Lưu file với tên UUID
-        file.save(temp_file_path)
-        print(f"Saved temp file: {temp_file_path}")
+        whisper = whisper_loader.get(timeout=0)
+        if whisper is None:
+            return component_unavailable(whisper_loader)
         
-        try:
-            print(f"Transcribing file: {file.filename}")
-              # Sử dụng Faster Whisper
-            segments, info = model.transcribe(temp_file_path, beam_size=5)
+        viseme_mapper = None
+        if align:
+            viseme_mapper = viseme_loader.get(timeout=0)
+            if viseme_mapper is None:
+                return component_unavailable(viseme_loader)
+        
+        # Decode upload trực tiếp trong memory, không ghi file tạm
+        with metrics.stage('decode'):
+            audio = decode_audio_bytes(data)
+        
+        print(f"Transcribing file: {file.filename}")
+        if stream:
+            segments, future = whisper.stream(audio, beam_size=TRANSCRIBE_BEAM_SIZE, priority=PRIORITY_BULK,
+                                              timeout=g.admission_ticket.remaining())
             
-            # Tổng hợp text từ các segments
-            full_text = ""
-            segment_list = []
+            def finish(segment_list):
+                _, info = future.result()
+                full_text = ''.join(segment['text'] for segment in segment_list).strip()
+                response = {
+                    'success': True,
+                    'filename': filename,
+                    'text': full_text,
+                    'language': info.language,
+                    'language_probability': info.language_probability,
+                    'duration': info.duration,
+                    'processing_time': round(time.time() - start_time, 2),
+                    'segments': segment_list,
+                    'model': f'faster-whisper-{model_size}',
+                    'ipa': text_to_ipa(full_text)
+                }
+                transcription_cache.put(cache_key, response)
+                return response
             
+            return Response(stream_transcription(filename, (segment_dict(segment) for segment in segments), finish),
+                            mimetype='application/x-ndjson')
+        
+        if long_mode == 'auto':
+            use_long = len(audio) >= LONG_AUDIO_MIN_DURATION * SAMPLE_RATE
+        else:
+            use_long = long_mode in ('1', 'true', 'yes')
+        
+        # Sử dụng Faster Whisper, upload xếp sau các chunk real-time
+        options = {'beam_size': TRANSCRIBE_BEAM_SIZE, 'priority': PRIORITY_BULK,
+                   'timeout': g.admission_ticket.remaining()}
+        if align:
+            options['word_timestamps'] = True
+        pieces = None
+        with metrics.stage('whisper_inference'):
+            if use_long:
+                segments, info, pieces = transcribe_long(whisper, audio, LONG_AUDIO_PIECE_MIN, LONG_AUDIO_PIECE_MAX,
+                                                         **options)
+            else:
+                segments, info = whisper.transcribe(audio, **options)
+        
+        # Tổng hợp text từ các segments
+        full_text = ""
+        segment_list = []
+        
+        with metrics.stage('segment_iteration'):
+            segments = list(segments)
             for segment in segments:
                 full_text += segment.text
-                segment_list.append({
-                    "id": segment.id,
-                    "start": segment.start,
-                    "end": segment.end,
-                    "text": segment.text                })
-            
-            processing_time = time.time() - start_time
-              # Chuyển đổi text sang IPA
-            print("Converting text to IPA...")
+                segment_list.append(segment_dict(segment))
+        
+        # Chuyển đổi text sang IPA (long-audio: từng piece trong một batch G2P rồi ghép lại)
+        print("Converting text to IPA...")
+        if pieces is not None:
+            piece_results, _ = texts_to_ipa([piece['text'] for piece in pieces])
+            for piece, piece_result in zip(pieces, piece_results):
+                piece['ipa'] = piece_result['g2p_ipa']
+            ipa_result = join_ipa(piece_results)
+        else:
             ipa_result = text_to_ipa(full_text.strip())
-            
-            response = {
-                'success': True,
-                'filename': secure_filename(file.filename),
-                'text': full_text.strip(),
-                'language': info.language,
-                'language_probability': info.language_probability,
-                'duration': info.duration,
-                'processing_time': round(processing_time, 2),
-                'segments': segment_list,
-                'model': f'faster-whisper-{model_size}',
-                'ipa': ipa_result
+        
+        animation = None
+        if align:
+            # G2P từng từ và phân bố phoneme trong khoảng thời gian thật của từ đó
+            words = words_to_ipa(segments)
+            animation_data = viseme_mapper.export_aligned_animation_data(words, fps, lookahead=lookahead)
+            if not animation_data['success']:
+                return jsonify({
+                    'success': False,
+                    'error': f'Animation generation failed: {animation_data.get("error", "Unknown error")}'
+                }), 500
+            animation = {
+                'duration': animation_data['duration'],
+                'fps': animation_data['fps'],
+                'total_frames': animation_data['total_frames'],
+                'visemes_count': len(animation_data['visemes']),
+                'phonemes_count': animation_data['phonemes_count'],
+                'keyframes': animation_data['keyframes'],
+                'visemes': animation_data['visemes']
             }
-            
-            print(f"Transcription completed in {processing_time:.2f}s")
+        
+        processing_time = time.time() - start_time
+        
+        response = {
+            'success': True,
+            'filename': filename,
+            'text': full_text.strip(),
+            'language': info.language,
+            'language_probability': info.language_probability,
+            'duration': info.duration,
+            'processing_time': round(processing_time, 2),
+            'segments': segment_list,
+            'model': f'faster-whisper-{model_size}',
+            'ipa': ipa_result
+        }
+        if align:
+            response['words'] = words
+            response['animation'] = animation
+        if pieces is not None:
+            response['pieces'] = pieces
+        transcription_cache.put(cache_key, response)
+        
+        print(f"Transcription completed in {processing_time:.2f}s")
+        with metrics.stage('serialization'):
             return jsonify(response)
-            
-        finally:
-            if os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
     
+    except Overloaded as e:
+        return overloaded(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -262,48 +650,48 @@ def transcribe_audio():
         }), 500
 
 @app.route('/transcribe_chunk', methods=['POST'])
+@admission_controlled(admission_gates['transcribe_chunk'])
 def transcribe_chunk():
     """Endpoint để xử lý audio chunks nhỏ cho real-time"""
     try:
         if 'chunk' not in request.files:
             return jsonify({'error': 'No chunk provided'}), 400
         
+        whisper = whisper_loader.get(timeout=0)
+        if whisper is None:
+            return component_unavailable(whisper_loader)
+        
         chunk = request.files['chunk']
         start_time = time.time()
         
-        # Tạo tên file tạm với UUID
-        uid = str(uuid.uuid4()) + '.wav'
-        temp_file_path = os.path.join(tempfile.gettempdir(), uid)
+        # Chunk WAV 16 kHz PCM đi fast path, không cần ffmpeg hay file tạm
+        with metrics.stage('decode'):
+            audio = decode_upload(chunk)
         
-        # Lưu chunk với tên UUID
-        chunk.save(temp_file_path)
-        print(f"Saved temp chunk: {temp_file_path}")
+        # Xử lý chunk nhỏ với beam_size nhỏ hơn để tăng tốc
+        with metrics.stage('whisper_inference'):
+            segments, info = whisper.transcribe(audio, beam_size=1, timeout=g.admission_ticket.remaining())
         
-        try:
-            # Xử lý chunk nhỏ với beam_size nhỏ hơn để tăng tốc
-            segments, info = model.transcribe(temp_file_path, beam_size=1)
-            
-            text = ""
+        text = ""
+        with metrics.stage('segment_iteration'):
             for segment in segments:
                 text += segment.text
-            
-            processing_time = time.time() - start_time
-            
-            # Chuyển đổi text sang IPA cho chunk
-            ipa_result = text_to_ipa(text.strip()) if text.strip() else {'g2p_ipa': '', 'epitran_ipa': '', 'success': True}
-            
-            return jsonify({
-                'success': True,
-                'text': text.strip(),
-                'processing_time': round(processing_time, 3),
-                'language': info.language,
-                'ipa': ipa_result
-            })
-            
-        finally:
-            if os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
+        
+        processing_time = time.time() - start_time
+        
+        # Chuyển đổi text sang IPA cho chunk
+        ipa_result = text_to_ipa(text.strip()) if text.strip() else {'g2p_ipa': '', 'epitran_ipa': '', 'success': True}
+        
+        return jsonify({
+            'success': True,
+            'text': text.strip(),
+            'processing_time': round(processing_time, 3),
+            'language': info.language,
+            'ipa': ipa_result
+        })
     
+    except Overloaded as e:
+        return overloaded(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -336,21 +724,156 @@ def convert_text_to_ipa():
             'error': str(e)
         }), 500
 
+@app.route('/text_to_ipa_batch', methods=['POST'])
+def convert_texts_to_ipa():
+    """Endpoint để chuyển đổi nhiều text sang IPA trong một request"""
+    try:
+        data = request.get_json()
+        if not data or 'texts' not in data:
+            return jsonify({'error': 'No texts provided'}), 400
+        
+        texts = data['texts']
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            return jsonify({'error': 'texts must be a list of strings'}), 400
+        
+        if len(texts) > MAX_IPA_BATCH_SIZE:
+            return jsonify({'error': f'Too many texts, maximum is {MAX_IPA_BATCH_SIZE}'}), 400
+        
+        start_time = time.time()
+        ipa_results, stats = texts_to_ipa([text.strip() for text in texts])
+        processing_time = time.time() - start_time
+        
+        return jsonify({
+            'success': True,
+            'count': len(texts),
+            'processing_time': round(processing_time, 3),
+            'unique_words': stats.get('unique_words'),
+            'computed_words': stats.get('computed_words'),
+            'results': [
+                {'original_text': text, 'ipa': ipa_result}
+                for text, ipa_result in zip(texts, ipa_results)
+            ]
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/score_pronunciation', methods=['POST'])
+def score_pronunciation():
+    """Endpoint chấm phát âm: so sánh IPA mong đợi với IPA người học nói"""
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        try:
+            result = score_items([data])[0]
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            **result
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/score_pronunciation_batch', methods=['POST'])
+def score_pronunciation_batch():
+    """Endpoint chấm phát âm cho cả lớp trong một request"""
+    try:
+        data = request.get_json()
+        if not data or 'items' not in data:
+            return jsonify({'error': 'No items provided'}), 400
+        
+        items = data['items']
+        if not isinstance(items, list):
+            return jsonify({'error': 'items must be a list'}), 400
+        
+        if len(items) > MAX_SCORING_BATCH_SIZE:
+            return jsonify({'error': f'Too many items, maximum is {MAX_SCORING_BATCH_SIZE}'}), 400
+        
+        # expected_text/expected_ipa ở ngoài dùng chung cho mọi item (cả lớp đọc cùng một câu)
+        shared = {key: data[key] for key in ('expected_text', 'expected_ipa') if key in data}
+        items = [{**shared, **item} if isinstance(item, dict) else item for item in items]
+        
+        start_time = time.time()
+        try:
+            results = score_items(items)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        processing_time = time.time() - start_time
+        
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'processing_time': round(processing_time, 3),
+            'average_score': round(sum(result['score'] for result in results) / len(results), 1) if results else None,
+            'results': results
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint, báo trạng thái load của từng model"""
+    components = {loader.name: loader.status() for loader in (whisper_loader, g2p_loader, viseme_loader)}
+    states = [component['status'] for component in components.values()]
+    if all(state == 'ready' for state in states):
+        status = 'healthy'
+    elif 'failed' in states:
+        status = 'degraded'
+    else:
+        status = 'loading'
+    
+    whisper = whisper_loader.get(timeout=0)
+    g2p_cache = g2p_loader.get(timeout=0)
     return jsonify({
-        'status': 'healthy',
+        'status': status,
         'model': f'faster-whisper-{model_size}',
-        'device': 'cpu',
+        'device': WHISPER_DEVICE,
+        'compute_type': WHISPER_COMPUTE_TYPE,
+        'pool_size': WHISPER_POOL_SIZE,
+        'components': components,
         'features': {
-            'speech_recognition': True,
-            'ipa_conversion': G2P_AVAILABLE,
-            'viseme_mapping': VISEME_AVAILABLE,
-            'real_face_animation': REAL_FACE_AVAILABLE
-        }
+            'speech_recognition': whisper_loader.ready,
+            'ipa_conversion': g2p_loader.ready,
+            'viseme_mapping': viseme_loader.ready,
+            'real_face_animation': REAL_FACE_AVAILABLE,
+            'streaming': whisper_loader.ready
+        },
+        'streaming_sessions': len(streaming_sessions),
+        'scheduler': whisper.stats() if whisper is not None else None,
+        'g2p_cache': g2p_cache.stats() if g2p_cache is not None else None,
+        'transcription_cache': transcription_cache.stats(),
+        'animation_cache': animation_cache.stats(),
+        'precompute_store': precompute_store.stats() if precompute_store is not None else None,
+        'admission': {name: gate.stats() for name, gate in admission_gates.items()}
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics: latency histogram theo stage/endpoint, cache, queue, thời gian load model"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 khi mọi model đã load xong, 503 nếu chưa"""
+    components = {loader.name: loader.status()['status'] for loader in (whisper_loader, g2p_loader, viseme_loader)}
+    ready = all(state == 'ready' for state in components.values())
+    return jsonify({'ready': ready, 'components': components}), 200 if ready else 503
+
 @app.route('/create_talking_avatar', methods=['POST'])
 def create_talking_avatar():
     """Tạo animation data cho talking avatar từ text hoặc audio"""
@@ -361,15 +884,65 @@ def create_talking_avatar():
             text = data.get('text', '')
             duration = float(data.get('duration', 3.0))
             fps = int(data.get('fps', 30))
+            blend_params = data
+            keyframe_format = data.get('format', 'frames')
+            encoding = data.get('encoding', 'json')
+            simplify = data.get('simplify')
+            stream = str(data.get('stream', 'false')).lower() in ('1', 'true', 'yes')
+            seed = data.get('seed')
+            start_frame = int(data.get('start_frame', 0))
+            end_frame = data.get('end_frame')
         else:
             text = request.form.get('text', '')
             duration = float(request.form.get('duration', 3.0))
             fps = int(request.form.get('fps', 30))
+            blend_params = request.form
+            keyframe_format = request.form.get('format', 'frames')
+            encoding = request.form.get('encoding', 'json')
+            simplify = request.form.get('simplify')
+            stream = request.form.get('stream', 'false').lower() in ('1', 'true', 'yes')
+            seed = request.form.get('seed')
+            start_frame = int(request.form.get('start_frame', 0))
+            end_frame = request.form.get('end_frame')
         
         if not text.strip():
             return jsonify({'error': 'No text provided'}), 400
         
-        if not VISEME_AVAILABLE:
+        try:
+            lookahead = blend_lookahead(blend_params)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # format=columnar: toàn bộ animation dưới dạng typed array theo channel
+        if keyframe_format not in ('frames', 'columnar'):
+            return jsonify({'error': "format must be 'frames' or 'columnar'"}), 400
+        if keyframe_format == 'columnar' and encoding not in ENCODINGS:
+            return jsonify({'error': f'encoding must be one of {list(ENCODINGS)}'}), 400
+        if keyframe_format == 'columnar' and encoding == 'msgpack' and not MSGPACK_AVAILABLE:
+            return jsonify({'error': 'msgpack encoding is not available on this server'}), 400
+        # simplify=<tolerance>: chỉ giữ các keyframe cần để dựng lại channel trong sai số đó
+        if simplify is not None:
+            if keyframe_format != 'columnar':
+                return jsonify({'error': 'simplify requires format=columnar'}), 400
+            simplify = float(simplify)
+            if simplify < 0:
+                return jsonify({'error': 'simplify tolerance must be >= 0'}), 400
+        if stream and keyframe_format == 'columnar' and encoding == 'msgpack':
+            return jsonify({'error': 'msgpack encoding cannot be streamed as NDJSON'}), 400
+        # seed: blink tái lập được; mặc định suy ra từ hash của input
+        if seed is not None:
+            seed = int(seed)
+        # start_frame/end_frame: chỉ trả một khoảng frame (seek trong player), end_frame không tính
+        if end_frame is not None:
+            end_frame = int(end_frame)
+        windowed = start_frame != 0 or end_frame is not None
+        if start_frame < 0 or (end_frame is not None and end_frame < start_frame):
+            return jsonify({'error': 'start_frame must be >= 0 and end_frame >= start_frame'}), 400
+        if stream and windowed:
+            return jsonify({'error': 'start_frame/end_frame cannot be combined with stream'}), 400
+        
+        viseme_mapper = viseme_loader.get(timeout=G2P_LOAD_TIMEOUT)
+        if viseme_mapper is None:
             return jsonify({'error': 'Viseme system not available'}), 500
         
         print(f"Creating talking avatar for text: '{text[:50]}...'")
@@ -386,14 +959,70 @@ def create_talking_avatar():
         
         ipa_text = ipa_result['g2p_ipa']
         
-        # Step 2: Convert IPA to animation data
-        animation_data = viseme_mapper.export_animation_data(ipa_text, duration, fps)
+        if stream:
+            # stream=true: NDJSON, keyframes tính và gửi theo từng batch thay vì dựng hết trong memory
+            track = viseme_mapper.viseme_track(ipa_text, duration, seed)
+            visemes = track['visemes']
+            header = {
+                'type': 'start',
+                'success': True,
+                'text': text,
+                'ipa_text': ipa_text,
+                'arpabet': ipa_result.get('arpabet', ''),
+                'animation': {
+                    'duration': duration,
+                    'fps': fps,
+                    'seed': track['seed'],
+                    'total_frames': viseme_mapper.total_frames(visemes, fps),
+                    'visemes_count': len(visemes),
+                    'phonemes_count': len([v for v in visemes if v['phoneme'] != ' ']),
+                    'visemes': visemes
+                }
+            }
+            return Response(stream_animation(viseme_mapper, visemes, header, fps, keyframe_format,
+                                             encoding, simplify, lookahead, start_time),
+                            mimetype='application/x-ndjson')
+        
+        # Step 2: Convert IPA to animation data, cùng input + seed thì dùng lại kết quả đã tính
+        cache_key = text_key(ipa_text, duration, fps, keyframe_format, 'auto' if seed is None else seed, lookahead,
+                             start_frame, end_frame)
+        animation_data = animation_cache.get(cache_key)
+        if animation_data is None:
+            if seed is None and precompute_store is not None:
+                # Store lưu toàn bộ animation format frames không blend; trường hợp khác resample từ visemes đã lưu
+                animation_data = precompute_store.get_animation(ipa_text, duration, fps)
+                if animation_data is not None and (keyframe_format == 'columnar' or lookahead is not None or windowed):
+                    stop_frame = animation_data['total_frames']
+                    if end_frame is not None:
+                        stop_frame = min(end_frame, stop_frame)
+                    animation_data['start_frame'] = min(start_frame, stop_frame)
+                    animation_data['end_frame'] = stop_frame
+                    animation_data['keyframes'] = viseme_mapper.build_keyframes(
+                        animation_data['visemes'], fps, keyframe_format, lookahead, animation_data['start_frame'], stop_frame)
+            if animation_data is None:
+                # Viseme track cache trong mapper dùng chung cho mọi fps, chỉ resample lại keyframes
+                animation_data = viseme_mapper.export_animation_data(ipa_text, duration, fps, keyframe_format, seed,
+                                                                     lookahead, start_frame, end_frame)
+            
+            if not animation_data['success']:
+                return jsonify({
+                    'success': False,
+                    'error': f'Animation generation failed: {animation_data.get("error", "Unknown error")}'
+                }), 500
+            animation_cache.put(cache_key, animation_data)
         
-        if not animation_data['success']:
-            return jsonify({
-                'success': False,
-                'error': f'Animation generation failed: {animation_data.get("error", "Unknown error")}'
-            }), 500
+        if keyframe_format == 'columnar':
+            columnar = animation_data['keyframes']
+            if simplify is not None:
+                with metrics.stage('simplify'):
+                    columnar = simplify_columnar(columnar, simplify)
+                print(f"Simplified keyframes to {columnar['reduction']['ratio']:.1%} of raw size")
+            with metrics.stage('serialization'):
+                keyframes = encode_columnar(columnar, encoding)
+        elif windowed:
+            keyframes = animation_data['keyframes']  # Client đã tự giới hạn khoảng frame
+        else:
+            keyframes = animation_data['keyframes'][:100]  # Limit keyframes for response size
         
         processing_time = time.time() - start_time
         
@@ -407,17 +1036,23 @@ def create_talking_avatar():
             'animation': {
                 'duration': animation_data['duration'],
                 'fps': animation_data['fps'],
+                'seed': animation_data['seed'],
                 'total_frames': animation_data['total_frames'],
+                'start_frame': animation_data.get('start_frame', 0),
+                'end_frame': animation_data.get('end_frame', animation_data['total_frames']),
                 'visemes_count': len(animation_data['visemes']),
                 'phonemes_count': animation_data['phonemes_count'],
-                'keyframes': animation_data['keyframes'][:100],  # Limit keyframes for response size
+                'keyframes': keyframes,
                 'visemes': animation_data['visemes']
             }
         }
         
-        print(f"Talking avatar created in {processing_time:.3f}s - {len(animation_data['keyframes'])} frames")
+        print(f"Talking avatar created in {processing_time:.3f}s - {animation_data['total_frames']} frames")
         
-        return jsonify(response)
+        with metrics.stage('serialization'):
+            if keyframe_format == 'columnar' and encoding == 'msgpack':
+                return Response(pack_msgpack(response), mimetype='application/x-msgpack')
+            return jsonify(response)
         
     except Exception as e:
         print(f"Error creating talking avatar: {e}")
@@ -426,11 +1061,141 @@ def create_talking_avatar():
             'error': str(e)
         }), 500
 
+def stream_animation(viseme_mapper, visemes, header, fps, keyframe_format, encoding, simplify, lookahead, start_time):
+    """NDJSON lines: 'start' with the viseme track, 'keyframes' batches of STREAM_BATCH_FRAMES frames, then 'done'"""
+    try:
+        yield ndjson(header)
+        batches = viseme_mapper.iter_keyframe_batches(visemes, fps, STREAM_BATCH_FRAMES, keyframe_format, lookahead)
+        for start_frame, keyframes in batches:
+            if keyframe_format == 'columnar':
+                if simplify is not None:
+                    keyframes = simplify_columnar(keyframes, simplify)
+                keyframes = encode_columnar(keyframes, encoding)
+            yield ndjson({'type': 'keyframes', 'start_frame': start_frame, 'keyframes': keyframes})
+        yield ndjson({'type': 'done', 'success': True, 'processing_time': round(time.time() - start_time, 3)})
+    except Exception as e:
+        yield ndjson({'type': 'error', 'success': False, 'error': str(e)})
+
+# Streaming sessions theo Socket.IO sid
+streaming_sessions = {}
+streaming_lock = threading.Lock()
+
+def stop_streaming_session(sid):
+    """Close the streaming session of a client, if any"""
+    with streaming_lock:
+        session = streaming_sessions.pop(sid, None)
+    if session is not None:
+        session.close()
+    return session
+
+def open_streaming_session(sid, options, emit):
+    """Create and register the streaming session of a client, None nếu Whisper chưa sẵn sàng"""
+    stop_streaming_session(sid)
+    
+    whisper = whisper_loader.get(timeout=0)
+    if whisper is None:
+        return None
+    
+    session = StreamingSession(
+        whisper,
+        text_to_ipa,
+        emit=emit,
+        beam_size=int(options.get('beam_size', 5)),
+        partial_interval=float(options.get('partial_interval', 1.0)),
+        silence_duration=float(options.get('silence_duration', 0.6))
+    )
+    with streaming_lock:
+        streaming_sessions[sid] = session
+    return session
+
+@socketio.on('start_stream')
+def start_stream(options=None):
+    """Bắt đầu streaming session: client gửi PCM 16-bit mono 16 kHz qua 'audio_chunk'"""
+    sid = request.sid
+    session = open_streaming_session(sid, options or {},
+                                     emit=lambda event, payload: socketio.emit(event, payload, to=sid))
+    if session is None:
+        return {'success': False, 'error': f"Component 'whisper' is {whisper_loader.state}"}
+    socketio.start_background_task(session.run)
+    
+    print(f"Streaming session started: {sid}")
+    return {'success': True, 'sample_rate': SAMPLE_RATE}
+
+@socketio.on('audio_chunk')
+def stream_audio_chunk(data):
+    """Nhận audio PCM từ client"""
+    session = streaming_sessions.get(request.sid)
+    if session is None:
+        return {'success': False, 'error': 'No active stream'}
+    session.feed(data)
+
+@socketio.on('stop_stream')
+def stop_stream():
+    """Kết thúc streaming, phần audio còn lại được finalize"""
+    session = stop_streaming_session(request.sid)
+    print(f"Streaming session stopped: {request.sid}")
+    return {'success': session is not None}
+
+@socketio.on('disconnect')
+def stream_disconnect(*args):
+    stop_streaming_session(request.sid)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    # Với response stream, đây là thời gian tới byte đầu tiên
+    started = getattr(g, 'request_started', None)
+    if started is not None and request.endpoint:
+        metrics.requests.observe(request.endpoint, time.perf_counter() - started)
+    return response
+
+def cache_samples(field):
+    """Một giá trị stats() của từng cache, theo label cache"""
+    g2p_cache = g2p_loader.get(timeout=0)
+    viseme_mapper = viseme_loader.get(timeout=0)
+    caches = {
+        'transcription': transcription_cache,
+        'animation': animation_cache,
+        'g2p': g2p_cache,
+        'viseme_track': viseme_mapper.track_cache if viseme_mapper is not None else None,
+        'precompute_store': precompute_store
+    }
+    return {(name,): cache.stats().get(field) for name, cache in caches.items() if cache is not None}
+
+def whisper_queue_depth():
+    whisper = whisper_loader.get(timeout=0)
+    return {None: whisper.stats()['queue_depth'] if whisper is not None else None}
+
+def admission_samples(field):
+    return {(name,): gate.stats()[field] for name, gate in admission_gates.items()}
+
+LOADERS = (whisper_loader, g2p_loader, viseme_loader)
+metrics.gauge('cache_hit_rate', 'Hit rate of each result cache', lambda: cache_samples('hit_rate'), ('cache',))
+metrics.gauge('cache_hits_total', 'Hits of each result cache', lambda: cache_samples('hits'), ('cache',), 'counter')
+metrics.gauge('cache_misses_total', 'Misses of each result cache', lambda: cache_samples('misses'), ('cache',), 'counter')
+metrics.gauge('whisper_queue_depth', 'Whisper jobs waiting or in flight', whisper_queue_depth)
+metrics.gauge('admission_active', 'Requests holding an admission slot', lambda: admission_samples('active'), ('endpoint',))
+metrics.gauge('admission_waiting', 'Requests waiting for an admission slot', lambda: admission_samples('waiting'), ('endpoint',))
+metrics.gauge('admission_rejected_total', 'Requests rejected with a full queue', lambda: admission_samples('rejected'),
+              ('endpoint',), 'counter')
+metrics.gauge('admission_shed_total', 'Queued requests shed past their deadline', lambda: admission_samples('shed'),
+              ('endpoint',), 'counter')
+metrics.gauge('admission_displaced_total', 'Queued requests dropped for newer ones when the queue was full',
+              lambda: admission_samples('displaced'), ('endpoint',), 'counter')
+metrics.gauge('streaming_sessions', 'Active Socket.IO streaming sessions', lambda: {None: len(streaming_sessions)})
+metrics.gauge('component_load_seconds', 'Model load time of each component',
+              lambda: {(loader.name,): loader.status()['load_time'] for loader in LOADERS}, ('component',))
+metrics.gauge('component_ready', '1 when the component has loaded',
+              lambda: {(loader.name,): int(loader.ready) for loader in LOADERS}, ('component',))
+
 @app.route('/talking_avatar_demo')
 def talking_avatar_demo():
     """Demo page cho talking avatar"""
     return render_template('talking_avatar.html')
 
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
     print("Starting Flask app...")
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+ARPAbet -> IPA - Bảng chuyển đổi dựng sẵn một lần khi import
+"""
+
+# Mapping ARPAbet base to IPA (không có stress numbers)
+ARPABET_BASE_TO_IPA = {
+    # Vowels
+    'AA': 'ɑː', 'AE': 'æ', 'AH': 'ʌ', 'AO': 'ɔ:', 'AW': 'aʊ', 'AY': 'aɪ',
+    'EH': 'ɛ', 'ER': 'ɜː', 'EY': 'eɪ', 'IH': 'ɪ', 'IY': 'i:', 'OW': 'oʊ',
+    'OY': 'ɔɪ', 'UH': 'ʊ', 'UW': 'u:',
+
+    # Consonants
+    'B': 'b', 'CH': 'tʃ', 'D': 'd', 'DH': 'ð', 'F': 'f',
+    'G': 'ɡ', 'HH': 'h', 'JH': 'dʒ', 'K': 'k', 'L': 'l',
+    'M': 'm', 'N': 'n', 'NG': 'ŋ', 'P': 'p', 'R': 'r',
+    'S': 's', 'SH': 'ʃ', 'T': 't', 'TH': 'θ', 'V': 'v',
+    'W': 'w', 'Y': 'j', 'Z': 'z', 'ZH': 'ʒ'
+}
+
+ARPABET_VOWELS = frozenset(['AA', 'AE', 'AH', 'AO', 'AW', 'AY', 'EH', 'ER', 'EY',
+                            'IH', 'IY', 'OW', 'OY', 'UH', 'UW'])
+
+# Unstressed vowels with their own IPA symbol
+UNSTRESSED_VOWELS = {
+    'AH': 'ə',  # unstressed AH becomes schwa
+    'ER': 'ɚ'   # unstressed ER
+}
+
+
+def _build_table():
+    """Dựng bảng token -> IPA cho mọi token có/không có stress number"""
+    table = {' ': ' '}
+    for base, ipa in ARPABET_BASE_TO_IPA.items():
+        table[base] = ipa
+        for digit in '0123456789':
+            token = base + digit
+            if base not in ARPABET_VOWELS:
+                # Consonants never carry stress markers
+                table[token] = ipa
+            elif digit == '1':  # Primary stress
+                table[token] = 'ˈ' + ipa
+            elif digit == '2':  # Secondary stress
+                table[token] = 'ˌ' + ipa
+            elif digit == '0':
+                table[token] = UNSTRESSED_VOWELS.get(base, ipa)
+            else:
+                table[token] = ipa
+    return table
+
+
+ARPABET_TO_IPA = _build_table()
+
+
+def arpabet_to_ipa(arpabet_symbols):
+    """Chuyển đổi ARPAbet symbols sang IPA với trọng âm"""
+    get = ARPABET_TO_IPA.get
+    # Fallback for unknown symbols: lowercase the token
+    return ''.join([get(symbol) or symbol.lower() for symbol in arpabet_symbols])
+
+
+def arpabet_to_ipa_batch(arpabet_lists):
+    """Convert many ARPAbet token lists at once, returning IPA strings in input order"""
+    get = ARPABET_TO_IPA.get
+    join = ''.join
+    return [join([get(symbol) or symbol.lower() for symbol in symbols])
+            for symbols in arpabet_lists]
+
+
+# Micro-benchmark: bảng dựng sẵn vs. cách cũ dựng dict mỗi lần gọi
+if __name__ == "__main__":
+    import random
+    import timeit
+
+    def legacy_arpabet_to_ipa(arpabet_symbols):
+        arpabet_to_ipa_map = dict(ARPABET_BASE_TO_IPA)
+        vowels = ['AA', 'AE', 'AH', 'AO', 'AW', 'AY', 'EH', 'ER', 'EY', 'IH', 'IY', 'OW', 'OY', 'UH', 'UW']
+        ipa_symbols = []
+        for symbol in arpabet_symbols:
+            if symbol == ' ':
+                ipa_symbols.append(' ')
+                continue
+            base_phoneme = symbol
+            stress_level = ''
+            if len(symbol) > 1 and symbol[-1].isdigit():
+                base_phoneme = symbol[:-1]
+                stress_level = symbol[-1]
+            if base_phoneme in arpabet_to_ipa_map:
+                ipa_phone = arpabet_to_ipa_map[base_phoneme]
+                if stress_level and base_phoneme in vowels:
+                    if stress_level == '1':
+                        ipa_phone = 'ˈ' + ipa_phone
+                    elif stress_level == '2':
+                        ipa_phone = 'ˌ' + ipa_phone
+                if base_phoneme == 'AH' and stress_level == '0':
+                    ipa_phone = 'ə'
+                elif base_phoneme == 'ER' and stress_level == '0':
+                    ipa_phone = 'ɚ'
+                ipa_symbols.append(ipa_phone)
+            else:
+                ipa_symbols.append(symbol.lower())
+        return ''.join(ipa_symbols)
+
+    # Same output for every token the table knows, plus unknown symbols
+    tokens = list(ARPABET_TO_IPA) + ['.', ',', '?', 'XX1', 'AH', '', 'q']
+    for token in tokens:
+        assert arpabet_to_ipa([token]) == legacy_arpabet_to_ipa([token]), token
+
+    random.seed(0)
+    sentences = []
+    for _ in range(1000):
+        sentence = []
+        for _ in range(random.randint(3, 12)):
+            sentence.extend(random.choices(tokens[:-7], k=random.randint(2, 7)))
+            sentence.append(' ')
+        sentences.append(sentence[:-1])
+
+    assert arpabet_to_ipa_batch(sentences) == [legacy_arpabet_to_ipa(s) for s in sentences]
+
+    runs = 20
+    legacy = timeit.timeit(lambda: [legacy_arpabet_to_ipa(s) for s in sentences], number=runs)
+    table = timeit.timeit(lambda: [arpabet_to_ipa(s) for s in sentences], number=runs)
+    batch = timeit.timeit(lambda: arpabet_to_ipa_batch(sentences), number=runs)
+
+    per_sentence = 1e6 / (runs * len(sentences))
+    print(f"legacy per-call : {legacy * per_sentence:.2f} us/sentence")
+    print(f"table per-call  : {table * per_sentence:.2f} us/sentence ({legacy / table:.1f}x)")
+    print(f"table batch     : {batch * per_sentence:.2f} us/sentence ({legacy / batch:.1f}x)")
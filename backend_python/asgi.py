@@ -0,0 +1,280 @@
+"""
+ASGI entry point - Phục vụ cùng các route của app.py trên event loop (uvicorn asgi:application)
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import socketio
+
+from app import (app as flask_app, whisper_loader, open_streaming_session, stop_streaming_session,
+                 admission_gates, SOCKETIO_ORIGINS, SAMPLE_RATE)
+
+CPU_COUNT = os.cpu_count() or 1
+# Thread chạy Flask handler của route Whisper; phần lớn thời gian chỉ chờ gate hoặc scheduler/pool.
+# Mặc định đủ cho mọi request gate cho phép (chạy + chờ), để request không xếp hàng trước khi tới gate
+GATE_CAPACITY = sum(gate.max_concurrent + gate.max_queue for gate in admission_gates.values())
+ASGI_INFERENCE_THREADS = int(os.environ.get('ASGI_INFERENCE_THREADS', max(CPU_COUNT * 4, GATE_CAPACITY)))
+# Thread cho route text (IPA, chấm phát âm, avatar), không bị request transcribe đang chờ chiếm chỗ
+ASGI_TEXT_THREADS = int(os.environ.get('ASGI_TEXT_THREADS', CPU_COUNT * 2))
+# Thread cho drain() của streaming session, chỉ bận khi có audio mới
+ASGI_STREAM_THREADS = int(os.environ.get('ASGI_STREAM_THREADS', CPU_COUNT * 2))
+ASGI_LIGHT_THREADS = int(os.environ.get('ASGI_LIGHT_THREADS', 4))
+
+# Route nhẹ có executor riêng để health check không phải xếp hàng sau inference
+LIGHT_PATHS = {'/', '/health', '/ready', '/metrics'}
+# Route dùng Whisper; mọi route khác chạy trên text_executor
+WHISPER_PATHS = {'/transcribe', '/transcribe_chunk'}
+
+inference_executor = ThreadPoolExecutor(ASGI_INFERENCE_THREADS, thread_name_prefix='asgi-inference')
+text_executor = ThreadPoolExecutor(ASGI_TEXT_THREADS, thread_name_prefix='asgi-text')
+stream_executor = ThreadPoolExecutor(ASGI_STREAM_THREADS, thread_name_prefix='asgi-stream')
+light_executor = ThreadPoolExecutor(ASGI_LIGHT_THREADS, thread_name_prefix='asgi-light')
+
+# Route có admission gate: kiểm tra chỗ trống trên event loop trước khi buffer upload
+GATED_PATHS = {'/transcribe': admission_gates['transcribe'], '/transcribe_chunk': admission_gates['transcribe_chunk']}
+# Số request đang upload dở cho mỗi gate, chưa tới được acquire() trong Flask
+uploading = {path: 0 for path in GATED_PATHS}
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+async def read_body(receive, limit):
+    """Buffer the request body on the event loop, so a slow upload holds no thread"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise RequestTooLarge()
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+def wsgi_environ(scope, body):
+    """WSGI environ for an ASGI http scope with an already-buffered body"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-length':
+            continue
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+            continue
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def call_flask(environ):
+    """Run the Flask app for one request; returns (status, headers, body iterator, first chunk)"""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    body = flask_app(environ, start_response)
+    iterator = iter(body)
+    first = next(iterator, None)
+    return started['status'], started['headers'], body, iterator, first
+
+
+async def send_simple(send, status, text):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': text.encode('utf-8')})
+
+
+async def send_overloaded(send, error):
+    """503 giống overloaded() của app, gửi trước khi đọc body"""
+    body = json.dumps({'success': False, 'error': str(error)}).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': 503,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'retry-after', str(error.retry_after).encode('latin-1'))]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def http_app(scope, receive, send):
+    """Uploads and response bodies move on the event loop; the Flask handler runs on a bounded executor"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for executor in (inference_executor, text_executor, stream_executor, light_executor):
+                    executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path']
+    gate = GATED_PATHS.get(path)
+    if gate is not None and not gate.has_room(uploading[path]):
+        await send_overloaded(send, gate.reject())
+        return
+
+    if gate is not None:
+        uploading[path] += 1
+    try:
+        body = await read_body(receive, flask_app.config.get('MAX_CONTENT_LENGTH'))
+    except RequestTooLarge:
+        await send_simple(send, 413, 'Request Entity Too Large')
+        return
+    finally:
+        if gate is not None:
+            uploading[path] -= 1
+    if body is None:
+        return
+
+    loop = asyncio.get_running_loop()
+    if path in LIGHT_PATHS:
+        executor = light_executor
+    elif path in WHISPER_PATHS:
+        executor = inference_executor
+    else:
+        executor = text_executor
+    status, headers, response, iterator, chunk = await loop.run_in_executor(
+        executor, call_flask, wsgi_environ(scope, body))
+
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        })
+        # Response stream (NDJSON) được kéo từng chunk trên executor, gửi đi trên event loop
+        while chunk is not None:
+            following = await loop.run_in_executor(executor, next, iterator, None)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': following is not None})
+            chunk = following
+    finally:
+        if hasattr(response, 'close'):
+            await loop.run_in_executor(executor, response.close)
+
+
+class SessionPump:
+    """Drives one StreamingSession from the event loop.
+
+    Instead of a thread blocked in ``session.run`` per client, the pump waits
+    on an ``asyncio.Event`` and runs ``session.drain`` on the stream executor
+    only after audio (or a stop) arrives, so an idle connection costs one
+    suspended coroutine.
+    """
+
+    def __init__(self, sid, session):
+        self.sid = sid
+        self.session = session
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def notify(self):
+        self.wakeup.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            if await loop.run_in_executor(stream_executor, self.session.drain):
+                break
+            if self.session.pending():
+                self.wakeup.set()
+        if pumps.get(self.sid) is self:
+            del pumps[self.sid]
+
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins=SOCKETIO_ORIGINS)
+pumps = {}
+
+
+def stop_pump(sid):
+    """Close the session of a client and let its pump finalize the remaining audio"""
+    session = stop_streaming_session(sid)
+    pump = pumps.pop(sid, None)
+    if pump is not None:
+        pump.notify()
+    return session
+
+
+@sio.on('start_stream')
+async def start_stream(sid, options=None):
+    """Bắt đầu streaming session: client gửi PCM 16-bit mono 16 kHz qua 'audio_chunk'"""
+    stop_pump(sid)
+    loop = asyncio.get_running_loop()
+
+    def emit(event, payload):
+        # Gọi từ thread của stream executor
+        asyncio.run_coroutine_threadsafe(sio.emit(event, payload, to=sid), loop)
+
+    session = open_streaming_session(sid, options or {}, emit)
+    if session is None:
+        return {'success': False, 'error': f"Component 'whisper' is {whisper_loader.state}"}
+    pumps[sid] = SessionPump(sid, session)
+
+    print(f"Streaming session started: {sid}")
+    return {'success': True, 'sample_rate': SAMPLE_RATE}
+
+
+@sio.on('audio_chunk')
+async def stream_audio_chunk(sid, data):
+    """Nhận audio PCM từ client"""
+    pump = pumps.get(sid)
+    if pump is None:
+        return {'success': False, 'error': 'No active stream'}
+    pump.session.feed(data)
+    pump.notify()
+
+
+@sio.on('stop_stream')
+async def stop_stream(sid):
+    """Kết thúc streaming, phần audio còn lại được finalize"""
+    session = stop_pump(sid)
+    print(f"Streaming session stopped: {sid}")
+    return {'success': session is not None}
+
+
+@sio.on('disconnect')
+async def stream_disconnect(sid, *args):
+    stop_pump(sid)
+
+
+application = socketio.ASGIApp(sio, other_asgi_app=http_app)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    print("Starting ASGI app...")
+    uvicorn.run(application, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,46 @@
+"""
+Audio I/O - Decode audio upload trực tiếp trong memory thành PCM float32 16 kHz
+"""
+import io
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000  # Whisper luôn làm việc với 16 kHz mono
+
+
+def decode_wav_pcm16(data):
+    """Fast path: parse 16-bit PCM WAV at 16 kHz without ffmpeg, None nếu không khớp"""
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        return None
+
+    try:
+        with wave.open(io.BytesIO(data), 'rb') as wav:
+            if wav.getsampwidth() != 2 or wav.getframerate() != SAMPLE_RATE:
+                return None
+            channels = wav.getnchannels()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+
+    audio = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768.0
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    return audio
+
+
+def decode_audio_bytes(data):
+    """Decode audio bytes (wav/mp3/m4a/ogg/webm/...) into a float32 mono 16 kHz array"""
+    audio = decode_wav_pcm16(data)
+    if audio is not None:
+        return audio
+
+    # Các định dạng khác đi qua PyAV, vẫn đọc từ memory
+    # (import muộn để app khởi động không phải chờ load faster_whisper)
+    from faster_whisper.audio import decode_audio
+    return decode_audio(io.BytesIO(data), sampling_rate=SAMPLE_RATE)
+
+
+def decode_upload(file_storage):
+    """Decode a werkzeug FileStorage upload without touching the disk"""
+    return decode_audio_bytes(file_storage.read())
@@ -0,0 +1,192 @@
+"""
+Bulk Transcribe - Transcribe cả thư mục recording offline, ghi JSONL (có checkpoint) và Parquet
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from admission import PRIORITY_BULK
+from audio_io import decode_audio_bytes, SAMPLE_RATE
+from long_audio import transcribe_long
+
+
+def find_recordings(directory, allowed_file):
+    """Relative paths of every allowed audio file under directory, sorted"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if allowed_file(name):
+                paths.append(os.path.relpath(os.path.join(root, name), directory))
+    return sorted(paths)
+
+
+def completed_paths(output_path):
+    """Paths already transcribed successfully in an existing JSONL output (checkpoint)"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as output:
+        for line in output:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue  # Dòng cuối bị cắt dở khi process dừng giữa chừng
+            if row.get('success'):
+                done.add(row['path'])
+    return done
+
+
+def read_recording(path):
+    """Reader pool task: read and decode one file into float32 16 kHz"""
+    with open(path, 'rb') as recording:
+        return decode_audio_bytes(recording.read())
+
+
+def transcribe_recording(service, whisper, path, audio, beam_size):
+    """Worker pool task: same transcription + text_to_ipa as /transcribe, returns one output row"""
+    start_time = time.time()
+    try:
+        options = {'beam_size': beam_size, 'priority': PRIORITY_BULK}
+        if len(audio) >= service.LONG_AUDIO_MIN_DURATION * SAMPLE_RATE:
+            segments, info, _ = transcribe_long(whisper, audio, service.LONG_AUDIO_PIECE_MIN,
+                                                service.LONG_AUDIO_PIECE_MAX, **options)
+        else:
+            segments, info = whisper.transcribe(audio, **options)
+        text = ''.join(segment.text for segment in segments).strip()
+        return {
+            'path': path,
+            'success': True,
+            'text': text,
+            'language': info.language,
+            'language_probability': info.language_probability,
+            'duration': info.duration,
+            'segments': [service.segment_dict(segment) for segment in segments],
+            'model': f'faster-whisper-{service.model_size}',
+            'ipa': service.text_to_ipa(text) if text else {'g2p_ipa': '', 'epitran_ipa': '', 'success': True},
+            'processing_time': round(time.time() - start_time, 3)
+        }
+    except Exception as e:
+        return {'path': path, 'success': False, 'error': str(e)}
+
+
+def write_parquet(jsonl_path, parquet_path):
+    """Convert the JSONL output to Parquet, keeping the last row of each path"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet output requires the pyarrow package")
+
+    rows = {}
+    with open(jsonl_path, encoding='utf-8') as output:
+        for line in output:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            rows[row['path']] = row
+    # IPA dict lưu dạng JSON string để schema không phụ thuộc field của từng row
+    records = [dict(row, ipa=json.dumps(row['ipa'], ensure_ascii=False) if 'ipa' in row else None)
+               for row in rows.values()]
+    # Row lỗi thiếu nhiều field, nên cột lấy theo hợp của mọi row
+    columns = list(dict.fromkeys(name for record in records for name in record))
+    pq.write_table(pa.Table.from_pydict({name: [record.get(name) for record in records] for name in columns}),
+                   parquet_path)
+    return len(records)
+
+
+def transcribe_directory(directory, output_path, parquet_path=None, readers=4, max_in_flight=16, beam_size=5):
+    """Transcribe every recording under directory, appending one JSONL row per file.
+
+    Files are decoded ``readers`` at a time ahead of inference, and up to
+    ``max_in_flight`` files are transcribed together so the app's scheduler
+    or worker pool can batch them. Rows are flushed as they finish, so a
+    restart skips files that already succeeded.
+    """
+    # Import muộn: app.py load model theo cấu hình env giống hệt server
+    import app as service
+
+    paths = find_recordings(directory, service.allowed_file)
+    done = completed_paths(output_path)
+    todo = [path for path in paths if path not in done]
+    print(f"Found {len(paths)} recordings, {len(done)} already done, {len(todo)} to transcribe")
+
+    whisper = service.whisper_loader.get(timeout=None)
+    if whisper is None:
+        raise RuntimeError(f"Whisper failed to load: {service.whisper_loader.error}")
+
+    stats = {'transcribed': 0, 'failed': 0, 'audio_seconds': 0.0}
+    start_time = time.time()
+    remaining = iter(todo)
+    tasks = {}
+
+    with ThreadPoolExecutor(readers, thread_name_prefix='bulk-reader') as reader, \
+            ThreadPoolExecutor(max_in_flight, thread_name_prefix='bulk-worker') as worker, \
+            open(output_path, 'a', encoding='utf-8') as output:
+
+        def start_read():
+            path = next(remaining, None)
+            if path is not None:
+                tasks[reader.submit(read_recording, os.path.join(directory, path))] = ('read', path)
+
+        def write_row(row):
+            output.write(json.dumps(row, ensure_ascii=False) + '\n')
+            output.flush()
+            if row['success']:
+                stats['transcribed'] += 1
+                stats['audio_seconds'] += row['duration']
+            else:
+                stats['failed'] += 1
+            finished = stats['transcribed'] + stats['failed']
+            print(f"[{finished}/{len(todo)}] {row['path']}: {'ok' if row['success'] else row['error']}")
+
+        # Prefetch: file đang decode + file đang transcribe không vượt quá max_in_flight + readers
+        for _ in range(max_in_flight + readers):
+            start_read()
+
+        while tasks:
+            finished, _ = wait(tasks, return_when=FIRST_COMPLETED)
+            for task in finished:
+                stage, path = tasks.pop(task)
+                if stage == 'read':
+                    try:
+                        audio = task.result()
+                    except Exception as e:
+                        write_row({'path': path, 'success': False, 'error': f'Decode failed: {e}'})
+                        start_read()
+                        continue
+                    tasks[worker.submit(transcribe_recording, service, whisper, path, audio, beam_size)] = \
+                        ('transcribe', path)
+                else:
+                    write_row(task.result())
+                    start_read()
+
+    wall_time = time.time() - start_time
+    stats['wall_seconds'] = round(wall_time, 3)
+    stats['audio_seconds'] = round(stats['audio_seconds'], 3)
+    stats['throughput'] = round(stats['audio_seconds'] / wall_time, 2) if wall_time > 0 else 0.0
+
+    if parquet_path:
+        stats['parquet_rows'] = write_parquet(output_path, parquet_path)
+    return stats
+
+
+# Transcribe an archive of recordings (one JSONL row per file)
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Transcribe a directory of recordings offline')
+    parser.add_argument('directory', help='directory to scan recursively for audio files')
+    parser.add_argument('output', help='JSONL output, also the resume checkpoint')
+    parser.add_argument('--parquet', default=None, help='also write the results to this Parquet file')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--max-in-flight', type=int, default=16)
+    parser.add_argument('--beam-size', type=int, default=5)
+    args = parser.parse_args()
+
+    stats = transcribe_directory(args.directory, args.output, args.parquet, args.readers,
+                                 args.max_in_flight, args.beam_size)
+    print(f"Transcribed {stats['transcribed']} files ({stats['failed']} failed): "
+          f"{stats['audio_seconds']:.1f}s of audio in {stats['wall_seconds']:.1f}s, "
+          f"{stats['throughput']:.2f} audio-seconds per wall-second")
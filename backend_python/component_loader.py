@@ -0,0 +1,69 @@
+"""
+Component Loader - Load model nặng trong background thread và theo dõi trạng thái
+"""
+import threading
+import time
+
+
+class ComponentLoader:
+    """Runs ``load()`` on a background thread and tracks loading/ready/failed.
+
+    Requests that need the component call ``get`` (optionally waiting for it)
+    while everything else keeps serving, and ``/health`` reports ``status()``.
+    """
+
+    def __init__(self, name, load):
+        self.name = name
+        self.load = load
+        self.state = 'pending'
+        self.value = None
+        self.error = None
+        self.started_at = None
+        self.load_time = None
+        self.done = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Bắt đầu load trong background thread"""
+        self.state = 'loading'
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self.run, name=f'load-{self.name}', daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            self.value = self.load()
+            self.state = 'ready'
+        except Exception as e:
+            print(f"Error loading {self.name}: {e}")
+            self.error = str(e)
+            self.state = 'failed'
+        finally:
+            self.load_time = time.time() - self.started_at
+            print(f"Component {self.name} {self.state} after {self.load_time:.2f}s")
+            self.done.set()
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def get(self, timeout=None):
+        """Return the loaded component, waiting up to ``timeout`` seconds; None if not ready"""
+        if self.state == 'loading' and timeout != 0:
+            self.done.wait(timeout)
+        return self.value if self.ready else None
+
+    def status(self):
+        """Trạng thái cho /health"""
+        if self.load_time is not None:
+            load_time = round(self.load_time, 3)
+        elif self.started_at is not None:
+            load_time = round(time.time() - self.started_at, 3)
+        else:
+            load_time = None
+        return {
+            'status': self.state,
+            'load_time': load_time,
+            'error': self.error
+        }
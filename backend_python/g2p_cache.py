@@ -0,0 +1,302 @@
+"""
+G2P Word Cache - Cache ARPAbet/IPA theo từng từ cho text_to_ipa
+"""
+import multiprocessing
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from g2p_en.expand import normalize_numbers
+from g2p_en.g2p import word_tokenize
+from nltk import pos_tag
+
+# G2p instance của mỗi worker process, load trong initializer
+_worker_g2p = None
+
+
+def _init_worker():
+    """Initializer cho worker process: load G2p riêng của worker"""
+    global _worker_g2p
+    if _worker_g2p is None:
+        from g2p_en import G2p
+        _worker_g2p = G2p()
+
+
+def _pronounce_words(words):
+    """Run CMU lookup / neural predict for a chunk of words inside a worker"""
+    prons = []
+    for word in words:
+        if word in _worker_g2p.cmu:
+            prons.append(_worker_g2p.cmu[word][0])
+        else:
+            prons.append(_worker_g2p.predict(word))
+    return prons
+
+
+def create_pool(workers):
+    """Create a forked process pool and start all its workers right away.
+
+    Call it before the process starts any threads (loaders, schedulers,
+    Socket.IO): a worker forked later could inherit a lock held by another
+    thread. The executor starts its own management threads here, so fork any
+    other worker processes (ModelWorkerPool) before calling it. Each worker
+    loads its own G2p.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                               initializer=_init_worker)
+    # Với fork, submit đầu tiên launch tất cả worker trước khi executor start thread quản lý
+    pool.submit(int)
+    return pool
+
+
+class G2PCache:
+    """Word-keyed ARPAbet/IPA cache in front of a g2p_en ``G2p`` instance.
+
+    Text is normalized and tokenized exactly like ``G2p.__call__``; each word is
+    then served from the warm-start lexicon, the LRU cache, the CMU dict or -
+    only for out-of-vocabulary words - the neural ``G2p.predict`` fallback.
+    Homographs still go through ``pos_tag`` so their pronunciation matches G2P.
+    """
+
+    def __init__(self, g2p, ipa_converter, max_size=50000, stage_timer=None, ipa_batch_converter=None):
+        self.g2p = g2p
+        self.ipa_converter = ipa_converter
+        # ipa_batch_converter(list các ARPAbet list) -> list IPA, mặc định gọi ipa_converter cho từng list
+        self.ipa_batch_converter = ipa_batch_converter or \
+            (lambda prons: [ipa_converter(list(pron)) for pron in prons])
+        self.max_size = max_size
+        # stage_timer(name) -> context manager đo thời gian từng stage (ví dụ Metrics.stage)
+        self.stage_timer = stage_timer or (lambda name: nullcontext())
+
+        # Pinned entries loaded from a lexicon file, never evicted
+        self.lexicon = {}
+        # word -> (arpabet tuple, ipa string), most recently used last
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.predictions = 0
+
+    def tokenize(self, text):
+        """Normalize and tokenize text giống như G2p.__call__"""
+        text = normalize_numbers(str(text))
+        text = ''.join(char for char in unicodedata.normalize('NFD', text)
+                       if unicodedata.category(char) != 'Mn')  # Strip accents
+        text = text.lower()
+        text = re.sub("[^ a-z'.,?!\\-]", "", text)
+        text = text.replace("i.e.", "that is")
+        text = text.replace("e.g.", "for example")
+        return word_tokenize(text)
+
+    def lookup(self, word):
+        """Return the cached (arpabet, ipa) entry for a word, or None"""
+        entry = self.lexicon.get(word)
+        with self.lock:
+            if entry is None:
+                entry = self.cache.get(word)
+                if entry is not None:
+                    self.cache.move_to_end(word)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def store(self, word, arpabet, ipa=None):
+        """Store the ARPAbet pronunciation of a word and return its entry, mapping the IPA unless given"""
+        if ipa is None:
+            ipa = self.ipa_converter(list(arpabet))
+        entry = (tuple(arpabet), ipa)
+        with self.lock:
+            self.cache[word] = entry
+            self.cache.move_to_end(word)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return entry
+
+    def pronounce(self, word):
+        """ARPAbet cho một từ không phải homograph: CMU dict, fallback neural"""
+        if word in self.g2p.cmu:
+            return self.g2p.cmu[word][0]
+        with self.lock:
+            self.predictions += 1
+        return self.g2p.predict(word)
+
+    def word(self, word):
+        """Return the (arpabet, ipa) entry for a single word, computing it on a miss"""
+        entry = self.lookup(word)
+        if entry is None:
+            entry = self.store(word, self.pronounce(word))
+        return entry
+
+    def convert(self, text):
+        """Convert text to (ARPAbet list, IPA string), same output as arpabet_to_ipa(g2p(text))"""
+        return self.convert_words(self.tokenize(text))
+
+    def map_ipa(self, prons):
+        """IPA of many ARPAbet lists, timed once as stage 'ipa_mapping'"""
+        if not prons:
+            return []
+        with self.stage_timer('ipa_mapping'):
+            return self.ipa_batch_converter(prons)
+
+    def convert_words(self, words):
+        """Convert already tokenized words to (ARPAbet list, IPA string)"""
+        # pos_tag is only needed to disambiguate homographs
+        tags = None
+        if any(word in self.g2p.homograph2features for word in words):
+            tags = [pos for _, pos in pos_tag(words)]
+
+        prons = []
+        ipa_parts = []
+        computed = {}  # word -> ARPAbet của từ cache miss trong text này
+        for index, word in enumerate(words):
+            ipa = None
+            if re.search("[a-z]", word) is None:
+                pron = [word]
+            elif word in self.g2p.homograph2features:
+                pron1, pron2, pos1 = self.g2p.homograph2features[word]
+                pron = pron1 if tags[index].startswith(pos1) else pron2
+            elif word in computed:
+                pron = computed[word]
+            else:
+                entry = self.lookup(word)
+                if entry is None:
+                    pron = computed[word] = self.pronounce(word)
+                else:
+                    pron, ipa = entry
+            prons.append(pron)
+            ipa_parts.append(ipa)
+
+        # Chỉ từ chưa có IPA trong cache mới cần mapping, đo một lần cho cả text
+        pending = [index for index, ipa in enumerate(ipa_parts) if ipa is None]
+        for index, ipa in zip(pending, self.map_ipa([prons[index] for index in pending])):
+            ipa_parts[index] = ipa
+        for index in pending:
+            if words[index] in computed:
+                self.store(words[index], prons[index], ipa_parts[index])
+
+        arpabet = []
+        for pron in prons:
+            arpabet.extend(pron)
+            arpabet.append(' ')
+        return arpabet[:-1], ' '.join(ipa_parts)
+
+    def is_cached(self, word):
+        """Check lexicon/LRU membership without touching hit/miss counters"""
+        return word in self.lexicon or word in self.cache
+
+    def convert_batch(self, texts, pool=None, min_pool_words=64, chunk_size=32):
+        """Convert many texts at once, running G2P only once per unique uncached word.
+
+        Missing OOV words are predicted in ``pool`` (see create_pool) when there
+        are at least ``min_pool_words`` of them, otherwise inline. Results keep the
+        input order. Returns (results, stats).
+        """
+        tokenized = [self.tokenize(text) for text in texts]
+
+        unique_words = set()
+        for words in tokenized:
+            unique_words.update(word for word in words
+                                if re.search("[a-z]", word) is not None
+                                and word not in self.g2p.homograph2features)
+        missing = sorted(word for word in unique_words if not self.is_cached(word))
+
+        # CMU dict lookups are cheap, only OOV words are worth shipping to the pool
+        computed = {}
+        oov = []
+        for word in missing:
+            if word in self.g2p.cmu:
+                computed[word] = self.g2p.cmu[word][0]
+            else:
+                oov.append(word)
+
+        if pool is not None and len(oov) >= min_pool_words:
+            chunks = [oov[i:i + chunk_size] for i in range(0, len(oov), chunk_size)]
+            for chunk, prons in zip(chunks, pool.map(_pronounce_words, chunks)):
+                computed.update(zip(chunk, prons))
+            with self.lock:
+                self.predictions += len(oov)
+        else:
+            for word in oov:
+                computed[word] = self.pronounce(word)
+
+        for (word, pron), ipa in zip(computed.items(), self.map_ipa(list(computed.values()))):
+            self.store(word, pron, ipa)
+
+        results = [self.convert_words(words) for words in tokenized]
+        return results, {
+            'unique_words': len(unique_words),
+            'computed_words': len(missing),
+            'predicted_words': len(oov)
+        }
+
+    def load_lexicon(self, path):
+        """Load a warm-start lexicon (CMU dict format: WORD  PH1 PH2 ...)"""
+        entries = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith(';;;') or line.startswith('#'):
+                    continue
+                parts = line.split()
+                if len(parts) < 2:
+                    continue
+                # Bỏ hậu tố biến thể kiểu CMU dict, ví dụ "READ(1)"
+                word = re.sub(r'\(\d+\)$', '', parts[0]).lower()
+                if word in self.lexicon or word in entries:
+                    continue
+                entries[word] = tuple(parts[1:])
+        for (word, arpabet), ipa in zip(entries.items(), self.ipa_batch_converter(list(entries.values()))):
+            self.lexicon[word] = (arpabet, ipa)
+        return len(entries)
+
+    def save_lexicon(self, path):
+        """Write lexicon + cached words to a file that load_lexicon can read back"""
+        with self.lock:
+            entries = dict(self.lexicon)
+            entries.update(self.cache)
+        with open(path, 'w', encoding='utf-8') as f:
+            for word in sorted(entries):
+                f.write(f"{word.upper()}  {' '.join(entries[word][0])}\n")
+        return len(entries)
+
+    def stats(self):
+        """Cache statistics cho /health"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self.cache),
+                'max_size': self.max_size,
+                'lexicon_size': len(self.lexicon),
+                'hits': self.hits,
+                'misses': self.misses,
+                'neural_predictions': self.predictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+
+# Build a warm-start lexicon from a corpus file
+if __name__ == "__main__":
+    import sys
+    from g2p_en import G2p
+
+    if len(sys.argv) != 3:
+        print("Usage: python g2p_cache.py <corpus.txt> <lexicon.txt>")
+        sys.exit(1)
+
+    from arpabet_ipa import arpabet_to_ipa, arpabet_to_ipa_batch
+
+    cache = G2PCache(G2p(), arpabet_to_ipa, max_size=10 ** 7, ipa_batch_converter=arpabet_to_ipa_batch)
+    with open(sys.argv[1], encoding='utf-8') as corpus:
+        for line in corpus:
+            if line.strip():
+                cache.convert(line)
+
+    saved = cache.save_lexicon(sys.argv[2])
+    print(f"Saved {saved} words to {sys.argv[2]}")
+    print(cache.stats())
@@ -0,0 +1,251 @@
+"""
+Inference Scheduler - Gom các request Whisper đồng thời thành batch
+"""
+import bisect
+import dataclasses
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+from faster_whisper import BatchedInferencePipeline
+
+from admission import DeadlineExceeded, PRIORITY_INTERACTIVE
+from audio_io import SAMPLE_RATE
+from transcriber import Transcriber
+
+
+class TranscriptionJob:
+    """One queued transcription request"""
+
+    def __init__(self, audio, options, on_segment=None, priority=PRIORITY_INTERACTIVE, timeout=None):
+        self.audio = audio
+        self.options = options
+        # Gọi với từng segment ngay khi decode xong (streaming response)
+        self.on_segment = on_segment
+        # Chỉ các job có cùng options mới chạy chung một batch; language được gom lại trong run_batch
+        self.key = tuple(sorted((name, value) for name, value in options.items() if name != 'language'))
+        self.duration = len(audio) / SAMPLE_RATE
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        # Job chưa chạy khi quá deadline bị bỏ (chunk real-time cũ không còn giá trị)
+        self.deadline = None if timeout is None else self.enqueued_at + timeout
+        self.future = Future()
+
+
+class BatchScheduler(Transcriber):
+    """Micro-batching front end for a single WhisperModel.
+
+    Request threads call ``transcribe`` (same arguments as
+    ``WhisperModel.transcribe``) and block on a future. One scheduler thread
+    owns the model: it takes the oldest job, waits at most ``max_wait`` seconds
+    for more jobs with the same options, then runs them as one batch through
+    faster-whisper's ``BatchedInferencePipeline`` by concatenating the audio
+    and passing each job as a clip timestamp. Segments are split back per job
+    with their timestamps and ids made relative to that job again.
+
+    Jobs longer than one Whisper window (``max_clip_duration``) run alone and
+    let the pipeline batch their own VAD chunks instead.
+
+    Each job has a ``priority`` (interactive chunks before bulk uploads) and an
+    optional ``timeout``; a job still queued past it fails with
+    ``DeadlineExceeded`` instead of running. Jobs without a ``language`` get
+    ``default_language`` when one is configured.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait=0.05, max_clip_duration=30.0, default_language=None):
+        self.pipeline = BatchedInferencePipeline(model=model)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_clip_duration = max_clip_duration
+        self.default_language = default_language
+
+        self.queue = deque()
+        self.condition = threading.Condition()
+
+        # Metrics
+        self.jobs_processed = 0
+        self.batches_run = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = {}
+        self.total_wait = 0.0
+        self.jobs_expired = 0
+
+        self.thread = threading.Thread(target=self.run, name='whisper-batch-scheduler', daemon=True)
+        self.thread.start()
+
+    def submit(self, audio, on_segment=None, priority=PRIORITY_INTERACTIVE, timeout=None, **options):
+        """Queue audio (float32 16 kHz) for transcription and return a Future"""
+        if len(audio) == 0:
+            audio = np.zeros(SAMPLE_RATE // 10, dtype=np.float32)
+        if options.get('language') is None and self.default_language:
+            options['language'] = self.default_language
+        job = TranscriptionJob(audio, options, on_segment, priority, timeout)
+        with self.condition:
+            self.queue.append(job)
+            self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+            self.condition.notify()
+        return job.future
+
+    def drop_expired(self):
+        """Fail queued jobs whose deadline has passed (caller holds the lock)"""
+        now = time.monotonic()
+        expired = [job for job in self.queue if job.deadline is not None and job.deadline <= now]
+        for job in expired:
+            self.queue.remove(job)
+            self.jobs_expired += 1
+            job.future.set_exception(DeadlineExceeded('Transcription job expired before it could run'))
+
+    def next_batch(self):
+        """Wait for jobs and collect the next batch, bounded by size and max_wait"""
+        with self.condition:
+            while True:
+                while not self.queue:
+                    self.condition.wait()
+                self.drop_expired()
+                if self.queue:
+                    break
+
+            # Job ưu tiên cao nhất, cũ nhất đi trước; deque giữ thứ tự đến nên min lấy job cũ nhất
+            first = min(self.queue, key=lambda job: job.priority)
+            if first.duration > self.max_clip_duration:
+                self.queue.remove(first)
+                return [first]
+
+            deadline = first.enqueued_at + self.max_wait
+            while True:
+                batch = sorted((job for job in self.queue
+                                if job.key == first.key and job.duration <= self.max_clip_duration),
+                               key=lambda job: job.priority)
+                batch = batch[:self.max_batch_size]
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            for job in batch:
+                self.queue.remove(job)
+            return batch
+
+    def run(self):
+        """Scheduler loop, chạy trên thread riêng và là nơi duy nhất gọi model"""
+        while True:
+            batch = self.next_batch()
+            started_at = time.monotonic()
+            try:
+                if len(batch) == 1 and batch[0].duration > self.max_clip_duration:
+                    self.run_long(batch[0])
+                else:
+                    self.run_batch(batch)
+            except Exception as e:
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+
+            with self.condition:
+                self.batches_run += 1
+                self.jobs_processed += len(batch)
+                self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+                self.total_wait += sum(started_at - job.enqueued_at for job in batch)
+
+    def run_long(self, job):
+        """Long audio: the pipeline splits it with VAD and batches the chunks itself"""
+        # BatchedInferencePipeline mặc định without_timestamps=True (một segment cho cả audio)
+        options = dict(job.options)
+        options.setdefault('without_timestamps', False)
+        segments, info = self.pipeline.transcribe(
+            job.audio, batch_size=self.max_batch_size, **options
+        )
+        collected = []
+        for segment in segments:
+            collected.append(segment)
+            if job.on_segment is not None:
+                job.on_segment(segment)
+        job.future.set_result((collected, info))
+
+    def run_batch(self, batch):
+        """Run short jobs as one batch and hand each job its own segments.
+
+        A batch-level info only carries the first clip's language, so the
+        batch runs once per language. Only jobs without a language (and no
+        default) are detected first, each with its own encoder pass; a job
+        alone in its batch is left to the pipeline's own detection.
+        """
+        options = {name: value for name, value in batch[0].options.items() if name != 'language'}
+        groups = {}
+        for job in batch:
+            language = job.options.get('language')
+            probability = None
+            if language is None and len(batch) > 1:
+                language, probability, _ = self.pipeline.model.detect_language(job.audio)
+            groups.setdefault(language, []).append((job, probability))
+        for language, members in groups.items():
+            self.run_clips([job for job, _ in members], dict(options, language=language),
+                           [probability for _, probability in members])
+
+    def run_clips(self, batch, options, language_probabilities=None):
+        """Concatenate the jobs' audio, decode it as one batch of clips and split the segments back"""
+        offsets = []
+        clips = []
+        position = 0
+        for job in batch:
+            offsets.append(position / SAMPLE_RATE)
+            # Clip timestamps tính bằng giây (faster-whisper >= 1.2; bản 1.1 hiểu là sample index)
+            clips.append({'start': position / SAMPLE_RATE, 'end': (position + len(job.audio)) / SAMPLE_RATE})
+            position += len(job.audio)
+
+        options = dict(options)
+        options.setdefault('without_timestamps', False)
+
+        audio = np.concatenate([job.audio for job in batch])
+        segments, info = self.pipeline.transcribe(
+            audio, clip_timestamps=clips, batch_size=len(batch), **options
+        )
+
+        per_job = [[] for _ in batch]
+        for segment in segments:
+            index = max(0, bisect.bisect_right(offsets, segment.start + 1e-3) - 1)
+            per_job[index].append(segment)
+
+        for index, (job, offset, job_segments) in enumerate(zip(batch, offsets, per_job)):
+            job_info = dataclasses.replace(info, duration=job.duration, duration_after_vad=job.duration)
+            if language_probabilities is not None and language_probabilities[index] is not None:
+                job_info = dataclasses.replace(job_info, language_probability=language_probabilities[index])
+            job_segments = [shift_segment(segment, offset, number)
+                            for number, segment in enumerate(job_segments, start=1)]
+            if job.on_segment is not None:
+                for segment in job_segments:
+                    job.on_segment(segment)
+            job.future.set_result((job_segments, job_info))
+
+    def stats(self):
+        """Queue depth và batch-size metrics"""
+        with self.condition:
+            return {
+                'queue_depth': len(self.queue),
+                'max_queue_depth': self.max_queue_depth,
+                'jobs_processed': self.jobs_processed,
+                'batches_run': self.batches_run,
+                'avg_batch_size': round(self.jobs_processed / self.batches_run, 2) if self.batches_run else 0.0,
+                'batch_sizes': dict(sorted(self.batch_sizes.items())),
+                'avg_queue_wait': round(self.total_wait / self.jobs_processed, 4) if self.jobs_processed else 0.0,
+                'jobs_expired': self.jobs_expired,
+                'max_batch_size': self.max_batch_size,
+                'max_wait': self.max_wait
+            }
+
+
+def shift_segment(segment, offset, number):
+    """Make a segment's id and timestamps relative to its own job"""
+    words = segment.words
+    if words:
+        words = [dataclasses.replace(word, start=round(word.start - offset, 3), end=round(word.end - offset, 3))
+                 for word in words]
+    return dataclasses.replace(
+        segment,
+        id=number,
+        start=round(segment.start - offset, 3),
+        end=round(segment.end - offset, 3),
+        words=words
+    )
@@ -0,0 +1,108 @@
+"""
+Long Audio - Cắt audio dài tại các khoảng lặng và transcribe các đoạn song song
+"""
+import dataclasses
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+
+FRAME_SIZE = 480  # 30ms frames, như energy VAD của streaming
+
+
+def frame_energy(audio, frame_size=FRAME_SIZE):
+    """RMS energy of each full frame"""
+    usable = len(audio) - len(audio) % frame_size
+    frames = audio[:usable].reshape(-1, frame_size)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def silence_cuts(audio, min_piece=15.0, max_piece=28.0, smoothing=0.3):
+    """Sample positions that split audio into pieces of ``min_piece``..``max_piece`` seconds.
+
+    Each cut goes at the quietest point (energy smoothed over ``smoothing``
+    seconds) of the allowed window, so pieces end in pauses rather than
+    mid-word. Pieces stay under one Whisper window so the scheduler can
+    batch them. Raises ValueError unless ``0 < min_piece < max_piece``.
+    """
+    if not min_piece > 0:
+        raise ValueError(f"LONG_AUDIO_PIECE_MIN must be > 0, got {min_piece}")
+    if not max_piece > min_piece:
+        raise ValueError(f"LONG_AUDIO_PIECE_MAX ({max_piece}) must be greater than "
+                         f"LONG_AUDIO_PIECE_MIN ({min_piece})")
+    max_samples = int(max_piece * SAMPLE_RATE)
+    if len(audio) <= max_samples:
+        return []
+
+    energy = frame_energy(audio)
+    width = max(1, int(smoothing * SAMPLE_RATE) // FRAME_SIZE)
+    smoothed = np.convolve(energy, np.ones(width) / width, mode='same')
+    # Mỗi cửa sổ có ít nhất một frame và mỗi cut tiến ít nhất một frame
+    min_frames = max(1, int(min_piece * SAMPLE_RATE) // FRAME_SIZE)
+    max_frames = max(min_frames + 1, max_samples // FRAME_SIZE)
+
+    cuts = []
+    start = 0  # frame
+    while len(audio) - start * FRAME_SIZE > max_samples:
+        window = smoothed[start + min_frames:start + max_frames]
+        if not len(window):
+            break  # Phần đuôi ngắn hơn một frame
+        cut = start + min_frames + int(np.argmin(window))
+        cuts.append(cut * FRAME_SIZE + FRAME_SIZE // 2)
+        start = cut
+    return cuts
+
+
+def merge_info(infos, durations, total_duration):
+    """One TranscriptionInfo for the whole file: language with the most audio, summed durations"""
+    votes = {}
+    for info, duration in zip(infos, durations):
+        votes[info.language] = votes.get(info.language, 0.0) + duration
+    language = max(votes, key=votes.get)
+    main = max((item for item in zip(infos, durations) if item[0].language == language), key=lambda item: item[1])[0]
+    return dataclasses.replace(
+        main,
+        duration=total_duration,
+        duration_after_vad=sum(info.duration_after_vad for info in infos)
+    )
+
+
+def transcribe_long(whisper, audio, min_piece=15.0, max_piece=28.0, **options):
+    """Transcribe long audio as silence-split pieces submitted together.
+
+    ``whisper`` is the app's BatchScheduler or ModelWorkerPool: all pieces are
+    queued at once, so a pool spreads them over its processes and each
+    scheduler batches them. Returns (segments, info, pieces) where segment
+    timestamps and ids are relative to the whole file again and ``pieces``
+    lists each piece's start, end and text.
+
+    A ``timeout`` option is the deadline of the request as a whole, so it
+    only applies to the first piece: the later pieces wait behind earlier
+    batches by design and must not expire there.
+    """
+    from inference_scheduler import shift_segment
+
+    bounds = [0] + silence_cuts(audio, min_piece, max_piece) + [len(audio)]
+    timeout = options.pop('timeout', None)
+    futures = [whisper.submit(audio[start:end], **(dict(options, timeout=timeout) if index == 0 else options))
+               for index, (start, end) in enumerate(zip(bounds, bounds[1:]))]
+
+    segments = []
+    infos = []
+    pieces = []
+    for (start, end), future in zip(zip(bounds, bounds[1:]), futures):
+        piece_segments, info = future.result()
+        offset = start / SAMPLE_RATE
+        # shift_segment trừ offset, nên truyền offset âm để cộng lại vị trí của piece
+        first_id = len(segments) + 1
+        segments.extend([shift_segment(segment, -offset, number)
+                         for number, segment in enumerate(piece_segments, start=first_id)])
+        infos.append(info)
+        pieces.append({
+            'start': round(offset, 3),
+            'end': round(end / SAMPLE_RATE, 3),
+            'text': ''.join(segment.text for segment in piece_segments).strip()
+        })
+
+    durations = [(end - start) / SAMPLE_RATE for start, end in zip(bounds, bounds[1:])]
+    return segments, merge_info(infos, durations, len(audio) / SAMPLE_RATE), pieces
@@ -0,0 +1,108 @@
+"""
+Metrics - Histogram thời gian từng stage và endpoint /metrics dạng Prometheus text
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket (giây) cho latency, từ sub-millisecond tới một request transcribe dài
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, Prometheus style"""
+
+    def __init__(self, name, help_text, label_name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self.lock:
+            series = self.series.get(label)
+            if series is None:
+                series = self.series[label] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for label, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    labels = format_labels({self.label_name: label, 'le': format_value(bound)})
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = format_labels({self.label_name: label, 'le': '+Inf'})
+                lines.append(f'{self.name}_bucket{labels} {series["count"]}')
+                labels = format_labels({self.label_name: label})
+                lines.append(f'{self.name}_sum{labels} {format_value(series["sum"])}')
+                lines.append(f'{self.name}_count{labels} {series["count"]}')
+        return lines
+
+
+class Metrics:
+    """Registry of stage/request histograms plus gauges sampled at scrape time.
+
+    ``stage(name)`` times a block of work inside a request; gauge collectors
+    registered with ``gauge`` return ``{labels tuple or None: value}`` and are
+    called on every ``render`` so caches and queues are read live.
+    """
+
+    def __init__(self):
+        self.stages = Histogram('stage_duration_seconds', 'Time spent in each processing stage', 'stage')
+        self.requests = Histogram('request_duration_seconds', 'End-to-end request latency', 'endpoint')
+        self.gauges = []
+
+    @contextmanager
+    def stage(self, name):
+        """Time a processing stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.observe(name, time.perf_counter() - started)
+
+    def gauge(self, name, help_text, collect, label_names=(), kind='gauge'):
+        """Register a gauge (or a counter read from elsewhere) sampled from ``collect()`` at scrape time"""
+        self.gauges.append((name, help_text, collect, label_names, kind))
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = self.stages.render() + self.requests.render()
+        for name, help_text, collect, label_names, kind in self.gauges:
+            try:
+                samples = collect()
+            except Exception as e:
+                print(f"Error collecting metric {name}: {e}")
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples.items():
+                if value is None:
+                    continue
+                label_text = format_labels(dict(zip(label_names, labels))) if labels else ''
+                lines.append(f'{name}{label_text} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,227 @@
+"""
+Model Worker Pool - Chạy nhiều process Whisper, mỗi process dùng một phần CPU
+"""
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from transcriber import Transcriber
+
+
+def fork_available():
+    """Worker pool cần fork: spawn sẽ import lại app.py trong mỗi worker"""
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def core_slices(pool_size, cpu_threads):
+    """Chia các core của process hiện tại thành pool_size phần, mỗi phần cpu_threads core"""
+    if hasattr(os, 'sched_getaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    return [cores[(index * cpu_threads) % len(cores):][:cpu_threads] or cores
+            for index in range(pool_size)]
+
+
+def worker_main(conn, cores, model_size, device, compute_type, cpu_threads, batch_size, max_wait,
+                default_language=None):
+    """Entry point của worker process: load model riêng và phục vụ job qua pipe"""
+    from faster_whisper import WhisperModel
+    from admission import DeadlineExceeded
+    from inference_scheduler import BatchScheduler
+
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+
+    model = WhisperModel(model_size, device=device, compute_type=compute_type,
+                         cpu_threads=cpu_threads, num_workers=1)
+    scheduler = BatchScheduler(model, max_batch_size=batch_size, max_wait=max_wait, default_language=default_language)
+    send_lock = threading.Lock()
+
+    def send_segment(job_id, segment):
+        with send_lock:
+            conn.send((job_id, None, segment))
+
+    def reply(job_id, future):
+        error = future.exception()
+        with send_lock:
+            if isinstance(error, DeadlineExceeded):
+                # Giữ nguyên loại lỗi để parent trả 503 thay vì 500
+                conn.send((job_id, False, error))
+            elif error is not None:
+                conn.send((job_id, False, str(error)))
+            else:
+                conn.send((job_id, True, future.result()))
+
+    with send_lock:
+        conn.send((None, True, os.getpid()))  # ready
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        # options gồm cả priority/timeout của scheduler
+        job_id, audio, options, stream = message
+        # stream: gửi từng segment về parent ngay khi decode xong
+        on_segment = (lambda segment, job_id=job_id: send_segment(job_id, segment)) if stream else None
+        future = scheduler.submit(audio, on_segment=on_segment, **options)
+        future.add_done_callback(lambda f, job_id=job_id: reply(job_id, f))
+
+
+class ModelWorker:
+    """Parent-side handle of one model process"""
+
+    def __init__(self, context, index, cores, config):
+        self.index = index
+        self.cores = cores
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=worker_main,
+            args=(child_conn,) + (cores,) + config,
+            name=f'whisper-worker-{index}',
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.segment_callbacks = {}
+        self.job_ids = itertools.count()
+        self.ready = False
+        self.alive = True
+        self.completed = 0
+        self.receiver = None
+
+    @property
+    def in_flight(self):
+        return len(self.pending)
+
+    def start_receiver(self):
+        self.receiver = threading.Thread(target=self.receive, name=f'whisper-worker-{self.index}-receiver', daemon=True)
+        self.receiver.start()
+
+    def submit(self, audio, options, on_segment=None):
+        future = Future()
+        with self.lock:
+            if not self.alive:
+                raise RuntimeError(f'Whisper worker {self.index} is not running')
+            job_id = next(self.job_ids)
+            self.pending[job_id] = future
+            if on_segment is not None:
+                self.segment_callbacks[job_id] = on_segment
+            self.conn.send((job_id, audio, options, on_segment is not None))
+        return future
+
+    def receive(self):
+        """Đọc kết quả từ worker và resolve future tương ứng"""
+        while True:
+            try:
+                job_id, ok, payload = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if job_id is None:
+                self.ready = True
+                print(f"Whisper worker {self.index} ready (pid {payload}, cores {self.cores})")
+                continue
+            if ok is None:
+                # Segment trung gian của một job streaming
+                on_segment = self.segment_callbacks.get(job_id)
+                if on_segment is not None:
+                    on_segment(payload)
+                continue
+            with self.lock:
+                future = self.pending.pop(job_id, None)
+                self.segment_callbacks.pop(job_id, None)
+                self.completed += 1
+            if future is None:
+                continue
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(payload if isinstance(payload, Exception) else RuntimeError(payload))
+
+        # Worker chết: fail mọi job đang chờ
+        with self.lock:
+            self.alive = False
+            pending = list(self.pending.values())
+            self.pending.clear()
+            self.segment_callbacks.clear()
+        for future in pending:
+            future.set_exception(RuntimeError(f'Whisper worker {self.index} exited'))
+
+
+class ModelWorkerPool(Transcriber):
+    """N Whisper model processes routed by least in-flight jobs.
+
+    Each worker loads its own ``WhisperModel`` with ``cpu_threads`` threads,
+    pinned to its own slice of cores where the OS supports it, and runs a
+    ``BatchScheduler`` so concurrent jobs routed to it are still batched.
+    ``transcribe`` has the same signature as ``WhisperModel.transcribe``.
+
+    Workers are forked, so the pool must be created before the parent process
+    starts any threads or loads other models. Its own receiver threads only
+    start in ``start``, once the caller has forked everything else it needs.
+    """
+
+    def __init__(self, pool_size, model_size, device='cpu', compute_type='int8', cpu_threads=0,
+                 batch_size=8, max_wait=0.05, default_language=None):
+        if cpu_threads <= 0:
+            cpu_threads = max(1, (os.cpu_count() or 1) // pool_size)
+        self.pool_size = pool_size
+        self.cpu_threads = cpu_threads
+
+        context = multiprocessing.get_context('fork')
+        config = (model_size, device, compute_type, cpu_threads, batch_size, max_wait, default_language)
+        slices = core_slices(pool_size, cpu_threads) if device == 'cpu' else [None] * pool_size
+        self.workers = [ModelWorker(context, index, slices[index], config) for index in range(pool_size)]
+
+    def start(self):
+        """Start the receiver threads; call after every process of the parent has been forked"""
+        for worker in self.workers:
+            worker.start_receiver()
+
+    def wait_ready(self, timeout=None):
+        """Block until at least one worker has loaded its model"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not any(worker.ready for worker in self.workers):
+            if not any(worker.alive for worker in self.workers):
+                raise RuntimeError('All Whisper workers exited before loading the model')
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError('Whisper workers did not become ready in time')
+            time.sleep(0.1)
+        return self
+
+    def submit(self, audio, on_segment=None, **options):
+        """Send a job to the least-loaded live worker and return a Future"""
+        workers = [worker for worker in self.workers if worker.alive]
+        if not workers:
+            raise RuntimeError('No Whisper workers are running')
+        worker = min(workers, key=lambda w: (not w.ready, w.in_flight))
+        return worker.submit(audio, options, on_segment)
+
+    def stats(self):
+        """Trạng thái từng worker"""
+        return {
+            'pool_size': self.pool_size,
+            'cpu_threads': self.cpu_threads,
+            'queue_depth': sum(worker.in_flight for worker in self.workers),
+            'workers': [
+                {
+                    'index': worker.index,
+                    'pid': worker.process.pid,
+                    'ready': worker.ready,
+                    'alive': worker.alive,
+                    'in_flight': worker.in_flight,
+                    'completed': worker.completed,
+                    'cores': worker.cores
+                }
+                for worker in self.workers
+            ]
+        }
@@ -0,0 +1,188 @@
+"""
+Precompute Store - IPA và viseme track tính sẵn cho corpus câu bài học, lưu trong SQLite
+"""
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from result_cache import text_key
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ipa (
+    key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    result TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS animation (
+    key TEXT PRIMARY KEY,
+    ipa_text TEXT NOT NULL,
+    duration REAL NOT NULL,
+    fps INTEGER NOT NULL,
+    result TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# VisemeMapper của worker process khi build store
+_worker_mapper = None
+
+
+def ipa_key(text):
+    """Store key của một câu text"""
+    return text_key(text.strip())
+
+
+def animation_key(ipa_text, duration, fps):
+    """Store key của một animation, cùng scheme với animation cache của app (format frames, seed mặc định)"""
+    return text_key(ipa_text, float(duration), int(fps), 'frames', 'auto')
+
+
+class PrecomputeStore:
+    """Read side of a precomputed SQLite store, indexed by content hash.
+
+    ``get_ipa`` and ``get_animation`` are single primary-key reads returning
+    the stored ``text_to_ipa`` / ``export_animation_data`` results, or None.
+    """
+
+    def __init__(self, path, readonly=True):
+        self.path = path
+        if readonly:
+            self.conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, table, key):
+        with self.lock:
+            row = self.conn.execute(f'SELECT result FROM {table} WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def get_ipa(self, text):
+        """Stored text_to_ipa result for text, or None"""
+        return self.lookup('ipa', ipa_key(text))
+
+    def get_animation(self, ipa_text, duration, fps):
+        """Stored export_animation_data result (frames format, default seed), or None"""
+        return self.lookup('animation', animation_key(ipa_text, duration, fps))
+
+    def put_ipa(self, items):
+        """Insert (text, text_to_ipa result) pairs"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO ipa (key, text, result) VALUES (?, ?, ?)',
+                [(ipa_key(text), text, json.dumps(result, ensure_ascii=False)) for text, result in items]
+            )
+
+    def put_animations(self, items, duration, fps):
+        """Insert (ipa_text, export_animation_data result) pairs"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO animation (key, ipa_text, duration, fps, result) VALUES (?, ?, ?, ?, ?)',
+                [(animation_key(ipa_text, duration, fps), ipa_text, duration, fps,
+                  json.dumps(result, ensure_ascii=False)) for ipa_text, result in items]
+            )
+
+    def counts(self):
+        with self.lock:
+            return {table: self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                    for table in ('ipa', 'animation')}
+
+    def stats(self):
+        """Store statistics cho /health"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'path': self.path,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
+
+    def close(self):
+        self.conn.close()
+
+
+def _init_worker():
+    """Initializer cho worker process: mỗi worker một VisemeMapper"""
+    global _worker_mapper
+    from viseme_system import VisemeMapper
+    _worker_mapper = VisemeMapper()
+
+
+def _export_animations(args):
+    """Compute animation data for a chunk of IPA strings inside a worker"""
+    ipa_texts, duration, fps = args
+    return [_worker_mapper.export_animation_data(ipa_text, duration, fps) for ipa_text in ipa_texts]
+
+
+def build_store(corpus_path, store_path, duration=3.0, fps=30, workers=None, chunk_size=64):
+    """Run text_to_ipa and export_animation_data over every corpus line and write them to the store"""
+    from g2p_en import G2p
+    from arpabet_ipa import arpabet_to_ipa, arpabet_to_ipa_batch
+    from g2p_cache import G2PCache, create_pool
+
+    workers = workers or os.cpu_count() or 1
+    with open(corpus_path, encoding='utf-8') as corpus:
+        texts = list(dict.fromkeys(line.strip() for line in corpus if line.strip()))
+    print(f"Precomputing {len(texts)} sentences with {workers} workers...")
+
+    # IPA: G2P chạy một lần cho mỗi từ duy nhất, OOV dự đoán song song trong pool
+    # (pool fork trước khi có thread nào khác trong process)
+    pool = create_pool(workers) if workers > 1 and 'fork' in multiprocessing.get_all_start_methods() else None
+    g2p_cache = G2PCache(G2p(), arpabet_to_ipa, max_size=10 ** 7, ipa_batch_converter=arpabet_to_ipa_batch)
+    try:
+        converted, stats = g2p_cache.convert_batch(texts, pool=pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    print(f"G2P done: {stats}")
+
+    ipa_results = [{
+        'success': True,
+        'g2p_ipa': ipa,
+        'arpabet': ' '.join(arpabet),
+        'epitran_ipa': ipa
+    } for arpabet, ipa in converted]
+
+    # Animation: chia IPA thành chunk, tính song song trong process pool
+    ipa_texts = list(dict.fromkeys(result['g2p_ipa'] for result in ipa_results))
+    chunks = [ipa_texts[i:i + chunk_size] for i in range(0, len(ipa_texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        animations = [result
+                      for chunk_results in executor.map(_export_animations, [(chunk, duration, fps) for chunk in chunks])
+                      for result in chunk_results]
+
+    store = PrecomputeStore(store_path, readonly=False)
+    try:
+        store.put_ipa(zip(texts, ipa_results))
+        store.put_animations([(ipa_text, animation) for ipa_text, animation in zip(ipa_texts, animations)
+                              if animation['success']], duration, fps)
+        return store.counts()
+    finally:
+        store.close()
+
+
+# Build the store from a lesson corpus (one sentence per line)
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Precompute IPA and viseme tracks for a lesson corpus')
+    parser.add_argument('corpus', help='text file, one sentence per line')
+    parser.add_argument('store', help='SQLite store to create or update')
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    counts = build_store(args.corpus, args.store, args.duration, args.fps, args.workers)
+    print(f"Saved {counts['ipa']} IPA entries and {counts['animation']} animations to {args.store}")
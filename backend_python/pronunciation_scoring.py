@@ -0,0 +1,176 @@
+"""
+Pronunciation Scoring - So sánh IPA mong đợi với IPA người học nói bằng weighted edit distance
+"""
+import re
+
+import numpy as np
+
+from arpabet_ipa import ARPABET_BASE_TO_IPA, ARPABET_VOWELS, UNSTRESSED_VOWELS
+from viseme_system import trie_pattern
+
+STRESS_AND_LENGTH = str.maketrans({'ˈ': None, 'ˌ': None, ':': 'ː'})
+
+# Cặp phoneme gần như tương đương (khác nhau chủ yếu ở trọng âm)
+NEAR_PAIRS = {('ə', 'ʌ'), ('ɚ', 'ɜː'), ('ɪ', 'iː'), ('ʊ', 'uː')}
+
+
+class PronunciationScorer:
+    """Aligns expected and spoken phoneme sequences with a weighted edit distance.
+
+    Phonemes come from one longest-match tokenizer over the IPA inventory that
+    ``arpabet_to_ipa`` emits (stress dropped, both length marks accepted).
+    Substitutions cost ``near_cost`` for near-equivalent pairs, ``class_cost``
+    within vowels or within consonants and ``cross_cost`` otherwise; insertions
+    and deletions cost ``indel_cost``. The DP runs row by row over a whole
+    batch at once: the diagonal/up moves are array operations and the left
+    move is a running minimum (``np.minimum.accumulate``).
+    """
+
+    def __init__(self, near_cost=0.25, class_cost=0.6, cross_cost=1.0, indel_cost=1.0):
+        self.indel_cost = indel_cost
+
+        vowels = {ARPABET_BASE_TO_IPA[base].translate(STRESS_AND_LENGTH) for base in ARPABET_VOWELS}
+        vowels.update(UNSTRESSED_VOWELS.values())
+        consonants = {ipa.translate(STRESS_AND_LENGTH) for base, ipa in ARPABET_BASE_TO_IPA.items()
+                      if base not in ARPABET_VOWELS}
+        self.phonemes = sorted(vowels) + sorted(consonants)
+        self.ids = {phoneme: index for index, phoneme in enumerate(self.phonemes)}
+        self.pattern = re.compile(trie_pattern(self.phonemes) + '|.ː?', re.S)
+
+        # Id cuối dành cho ký hiệu ngoài bảng: chỉ khớp với chính nó qua so sánh chuỗi
+        size = len(self.phonemes) + 1
+        is_vowel = np.array([phoneme in vowels for phoneme in self.phonemes] + [False])
+        costs = np.where(is_vowel[:, None] == is_vowel[None, :], class_cost, cross_cost)
+        for first, second in NEAR_PAIRS:
+            if first in self.ids and second in self.ids:
+                costs[self.ids[first], self.ids[second]] = costs[self.ids[second], self.ids[first]] = near_cost
+        np.fill_diagonal(costs, 0.0)
+        costs[size - 1, size - 1] = cross_cost
+        self.costs = costs
+        self.unknown_id = size - 1
+
+    def tokenize(self, ipa_text):
+        """Return (phonemes, word index of each phoneme), spaces separate words"""
+        phonemes = []
+        words = []
+        for word_index, word in enumerate(ipa_text.translate(STRESS_AND_LENGTH).split()):
+            tokens = [token for token in self.pattern.findall(word) if any(char.isalpha() for char in token)]
+            phonemes.extend(tokens)
+            words.extend([word_index] * len(tokens))
+        return phonemes, words
+
+    def encode(self, phonemes):
+        return np.array([self.ids.get(phoneme, self.unknown_id) for phoneme in phonemes], dtype=np.int64)
+
+    def substitution_costs(self, expected, spoken):
+        """Substitution cost matrix of one pair; unknown symbols match only themselves"""
+        costs = self.costs[self.encode(expected)[:, None], self.encode(spoken)[None, :]]
+        unknown = [(i, j) for i, a in enumerate(expected) if a not in self.ids
+                   for j, b in enumerate(spoken) if a == b]
+        for i, j in unknown:
+            costs[i, j] = 0.0
+        return costs
+
+    def distance_tables(self, pairs):
+        """Full DP tables for a batch of (expected, spoken) phoneme lists, padded to the longest pair"""
+        rows = max((len(expected) for expected, _ in pairs), default=0)
+        columns = max((len(spoken) for _, spoken in pairs), default=0)
+
+        # Padding dùng cost 0; ô padding không ảnh hưởng các ô nằm trong kích thước thật của pair
+        substitution = np.zeros((len(pairs), rows, columns))
+        for index, (expected, spoken) in enumerate(pairs):
+            substitution[index, :len(expected), :len(spoken)] = self.substitution_costs(expected, spoken)
+
+        offsets = np.arange(columns + 1) * self.indel_cost
+        tables = np.empty((len(pairs), rows + 1, columns + 1))
+        tables[:, 0, :] = offsets
+        for row in range(1, rows + 1):
+            previous = tables[:, row - 1, :]
+            current = np.empty_like(previous)
+            current[:, 0] = previous[:, 0] + self.indel_cost
+            current[:, 1:] = np.minimum(previous[:, 1:] + self.indel_cost,
+                                        previous[:, :-1] + substitution[:, row - 1, :])
+            # Insertion (đi sang trái) là running minimum sau khi trừ chi phí tuyến tính theo cột
+            tables[:, row, :] = np.minimum.accumulate(current - offsets, axis=1) + offsets
+        return tables, substitution
+
+    def backtrace(self, table, substitution, expected, spoken, expected_words):
+        """Walk the DP table back into per-phoneme errors"""
+        errors = []
+        matches = 0
+        row, column = len(expected), len(spoken)
+        while row > 0 or column > 0:
+            if row > 0 and column > 0 and np.isclose(
+                    table[row, column], table[row - 1, column - 1] + substitution[row - 1, column - 1]):
+                if expected[row - 1] == spoken[column - 1]:
+                    matches += 1
+                else:
+                    errors.append({
+                        'type': 'substitution',
+                        'position': row - 1,
+                        'word_index': expected_words[row - 1],
+                        'expected': expected[row - 1],
+                        'spoken': spoken[column - 1]
+                    })
+                row -= 1
+                column -= 1
+            elif row > 0 and np.isclose(table[row, column], table[row - 1, column] + self.indel_cost):
+                errors.append({
+                    'type': 'deletion',
+                    'position': row - 1,
+                    'word_index': expected_words[row - 1],
+                    'expected': expected[row - 1]
+                })
+                row -= 1
+            else:
+                errors.append({
+                    'type': 'insertion',
+                    'position': row,
+                    'word_index': expected_words[row] if row < len(expected) else
+                                  (expected_words[-1] if expected_words else 0),
+                    'spoken': spoken[column - 1]
+                })
+                column -= 1
+        errors.reverse()
+        return errors, matches
+
+    def score_batch(self, ipa_pairs, chunk_size=64):
+        """Score many (expected_ipa, spoken_ipa) pairs, returning one result dict per pair.
+
+        Pairs are sorted by length and run ``chunk_size`` at a time so padding
+        and table memory stay small for a whole class of mixed-length answers.
+        """
+        tokenized = [(self.tokenize(expected), self.tokenize(spoken)) for expected, spoken in ipa_pairs]
+        order = sorted(range(len(tokenized)), key=lambda i: (len(tokenized[i][0][0]), len(tokenized[i][1][0])))
+
+        results = [None] * len(tokenized)
+        for start in range(0, len(order), chunk_size):
+            chunk = order[start:start + chunk_size]
+            tables, substitution = self.distance_tables(
+                [(tokenized[i][0][0], tokenized[i][1][0]) for i in chunk])
+            for offset, index in enumerate(chunk):
+                results[index] = self.pair_result(tables[offset], substitution[offset], *tokenized[index])
+        return results
+
+    def pair_result(self, table, substitution, expected_tokens, spoken_tokens):
+        """Result dict of one pair from its DP table"""
+        (expected, expected_words), (spoken, _) = expected_tokens, spoken_tokens
+        distance = float(table[len(expected), len(spoken)])
+        errors, matches = self.backtrace(table, substitution, expected, spoken, expected_words)
+        counts = {'matches': matches}
+        for kind in ('substitution', 'insertion', 'deletion'):
+            counts[kind + 's'] = sum(1 for error in errors if error['type'] == kind)
+        reference = max(len(expected), 1)
+        return {
+            'expected_phonemes': expected,
+            'spoken_phonemes': spoken,
+            'distance': round(distance, 4),
+            'score': round(max(0.0, 1.0 - distance / reference) * 100, 1),
+            'accuracy': round(matches / reference, 4),
+            'counts': counts,
+            'errors': errors
+        }
+
+    def score(self, expected_ipa, spoken_ipa):
+        """Score a single pair"""
+        return self.score_batch([(expected_ipa, spoken_ipa)])[0]
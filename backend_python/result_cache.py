@@ -0,0 +1,109 @@
+"""
+Result Cache - LRU cache cho kết quả đã tính, có thể lưu thêm xuống disk
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def audio_key(data, *parts):
+    """Content-addressed key: sha256 of the audio bytes plus the options that change the result"""
+    digest = hashlib.sha256(data).hexdigest()
+    return ':'.join([digest] + [str(part) for part in parts])
+
+
+def text_key(text, *parts):
+    """Content-addressed key for text input, same scheme as audio_key"""
+    return audio_key(text.encode('utf-8'), *parts)
+
+
+class ResultCache:
+    """Bounded in-memory LRU of JSON-serializable results with an optional disk tier.
+
+    When ``disk_dir`` is set every stored result is also written there as one
+    JSON file per key, so results survive restarts and memory evictions; a
+    memory miss that hits the disk promotes the entry back into memory.
+    """
+
+    def __init__(self, max_entries=256, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir or None
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def disk_path(self, key):
+        """File của một key trên disk, chia thư mục theo 2 ký tự đầu của hash"""
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, name[:2], name + '.json')
+
+    def get(self, key):
+        """Return the cached result for key, or None"""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self.disk_dir:
+            try:
+                with open(self.disk_path(key), encoding='utf-8') as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                self.remember(key, value)
+                with self.lock:
+                    self.disk_hits += 1
+                return value
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def remember(self, key, value):
+        """Put a value in the memory tier only"""
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def put(self, key, value):
+        """Store a result in memory and, if enabled, on disk"""
+        self.remember(key, value)
+        if not self.disk_dir:
+            return
+
+        path = self.disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing result cache entry: {e}")
+
+    def stats(self):
+        """Cache statistics cho /health"""
+        with self.lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_entries': self.max_entries,
+                'disk_dir': self.disk_dir,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / total, 4) if total else 0.0
+            }
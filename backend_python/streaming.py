@@ -0,0 +1,207 @@
+"""
+Streaming Transcription - Session real-time cho mỗi client WebSocket
+"""
+import threading
+import time
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+
+
+class StreamingSession:
+    """Rolling-buffer, VAD-gated incremental transcription for one client.
+
+    Audio arrives as 16-bit PCM mono at 16 kHz through ``feed``. A worker loop
+    (``run``) drains everything received since its last pass, so a slow decode
+    coalesces pending audio instead of falling behind. Only the current
+    utterance is ever decoded: partial results re-decode it with greedy search
+    every ``partial_interval`` seconds of new speech, and once the speaker
+    pauses for ``silence_duration`` (or the utterance hits ``max_utterance``)
+    it is decoded one final time with beam search and dropped from the buffer.
+    Finalized text is kept as the ``initial_prompt`` context for the next one.
+    """
+
+    FRAME_SIZE = 480  # 30ms frames cho energy VAD
+
+    def __init__(self, model, ipa_converter, emit, beam_size=5, partial_interval=1.0,
+                 silence_duration=0.6, max_utterance=20.0, energy_threshold=0.01,
+                 preroll=0.3, context_chars=200):
+        self.model = model
+        self.ipa_converter = ipa_converter
+        self.emit = emit
+        self.beam_size = beam_size
+        self.partial_samples = int(partial_interval * SAMPLE_RATE)
+        self.silence_samples = int(silence_duration * SAMPLE_RATE)
+        self.max_samples = int(max_utterance * SAMPLE_RATE)
+        self.preroll_frames = max(1, int(preroll * SAMPLE_RATE) // self.FRAME_SIZE)
+        self.energy_threshold = energy_threshold
+        self.context_chars = context_chars
+
+        self.condition = threading.Condition()
+        self.inbox = []
+        self.closed = False
+
+        # Samples received but not yet a full VAD frame
+        self.remainder = np.zeros(0, dtype=np.float32)
+        self.position = 0  # samples processed since stream start
+        self.preroll = []
+        self.frames = []
+        self.utterance_samples = 0
+        self.utterance_start = 0
+        self.silence = 0
+        self.since_partial = 0
+        self.last_partial = ''
+        self.context = ''
+        self.language = None
+
+    def feed(self, data):
+        """Queue a chunk of little-endian 16-bit PCM from the client"""
+        data = data[:len(data) - len(data) % 2]
+        samples = np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768.0
+        with self.condition:
+            if self.closed:
+                return
+            self.inbox.append(samples)
+            self.condition.notify()
+
+    def close(self):
+        """Stop the session, the remaining speech is finalized by run()"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def run(self):
+        """Worker loop, chạy trong background task của Socket.IO"""
+        while True:
+            with self.condition:
+                while not self.inbox and not self.closed:
+                    self.condition.wait()
+            if self.drain():
+                break
+
+    def pending(self):
+        """True when audio or a close is waiting for drain()"""
+        with self.condition:
+            return bool(self.inbox) or self.closed
+
+    def drain(self):
+        """Process everything received so far without waiting, True once the session is finished.
+
+        ``run`` calls this from its own thread; the ASGI server instead calls
+        it on an executor only when audio arrives, so an idle session holds
+        no thread.
+        """
+        with self.condition:
+            chunks = self.inbox
+            self.inbox = []
+            closed = self.closed
+
+        try:
+            if chunks:
+                self.process(np.concatenate(chunks))
+            if closed and self.frames:
+                self.finalize()
+        except Exception as e:
+            print(f"Streaming transcription error: {e}")
+            self.emit('transcript_error', {'success': False, 'error': str(e)})
+        return closed
+
+    def process(self, samples):
+        """Run the energy VAD over new audio and decode when needed"""
+        audio = np.concatenate([self.remainder, samples])
+        usable = len(audio) - len(audio) % self.FRAME_SIZE
+        self.remainder = audio[usable:]
+        if not usable:
+            return
+
+        frames = audio[:usable].reshape(-1, self.FRAME_SIZE)
+        voiced = np.sqrt(np.mean(frames * frames, axis=1)) > self.energy_threshold
+
+        for frame, is_voiced in zip(frames, voiced):
+            self.position += self.FRAME_SIZE
+
+            if not self.frames:
+                if not is_voiced:
+                    # Giữ lại một đoạn ngắn trước khi bắt đầu nói để không mất phụ âm đầu
+                    self.preroll.append(frame)
+                    if len(self.preroll) > self.preroll_frames:
+                        self.preroll.pop(0)
+                    continue
+                self.frames = self.preroll + [frame]
+                self.preroll = []
+                self.utterance_samples = len(self.frames) * self.FRAME_SIZE
+                self.utterance_start = self.position - self.utterance_samples
+                self.since_partial = self.utterance_samples
+                self.silence = 0
+                continue
+
+            self.frames.append(frame)
+            self.utterance_samples += self.FRAME_SIZE
+            self.since_partial += self.FRAME_SIZE
+            self.silence = 0 if is_voiced else self.silence + self.FRAME_SIZE
+
+            if self.silence >= self.silence_samples or self.utterance_samples >= self.max_samples:
+                self.finalize()
+
+        if self.frames and self.since_partial >= self.partial_samples:
+            self.partial()
+
+    def decode(self, audio, beam_size):
+        """Transcribe one utterance with the finalized text as context"""
+        segments, info = self.model.transcribe(
+            audio,
+            beam_size=beam_size,
+            language=self.language,
+            initial_prompt=self.context or None,
+            condition_on_previous_text=False,
+            without_timestamps=True
+        )
+        text = ''.join(segment.text for segment in segments).strip()
+        if self.language is None:
+            # Chỉ detect ngôn ngữ một lần cho cả session
+            self.language = info.language
+        return text
+
+    def partial(self):
+        """Decode the current utterance greedily and push a partial result"""
+        self.since_partial = 0
+        text = self.decode(np.concatenate(self.frames), beam_size=1)
+        if text and text != self.last_partial:
+            self.last_partial = text
+            self.emit('transcript_partial', {
+                'success': True,
+                'text': text,
+                'ipa': self.ipa_converter(text),
+                'start': round(self.utterance_start / SAMPLE_RATE, 2)
+            })
+
+    def finalize(self):
+        """Decode the finished utterance with beam search and push the final result"""
+        start_time = time.time()
+
+        # Bỏ phần im lặng cuối utterance trước khi decode
+        keep = max(1, len(self.frames) - self.silence // self.FRAME_SIZE + 3)
+        audio = np.concatenate(self.frames[:keep])
+        start = self.utterance_start
+        end = start + self.utterance_samples
+
+        self.frames = []
+        self.utterance_samples = 0
+        self.silence = 0
+        self.since_partial = 0
+        self.last_partial = ''
+
+        text = self.decode(audio, beam_size=self.beam_size)
+        if not text:
+            return
+
+        self.context = (self.context + ' ' + text).strip()[-self.context_chars:]
+        self.emit('transcript_final', {
+            'success': True,
+            'text': text,
+            'ipa': self.ipa_converter(text),
+            'start': round(start / SAMPLE_RATE, 2),
+            'end': round(end / SAMPLE_RATE, 2),
+            'processing_time': round(time.time() - start_time, 3)
+        })
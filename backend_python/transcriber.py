@@ -0,0 +1,27 @@
+"""
+Transcriber - Các hàm blocking/streaming dùng chung cho mọi front end Whisper có submit()
+"""
+import queue
+
+
+class Transcriber:
+    """Base of BatchScheduler and ModelWorkerPool.
+
+    Subclasses implement ``submit(audio, on_segment=None, **options)``
+    returning a Future of (segments list, info); ``transcribe`` and
+    ``stream`` are built on it.
+    """
+
+    def submit(self, audio, on_segment=None, **options):
+        raise NotImplementedError
+
+    def transcribe(self, audio, **options):
+        """Blocking drop-in for WhisperModel.transcribe, returns (segments list, info)"""
+        return self.submit(audio, **options).result()
+
+    def stream(self, audio, **options):
+        """Return (iterator of segments as they are decoded, Future of (segments, info))"""
+        segments = queue.Queue()
+        future = self.submit(audio, on_segment=segments.put, **options)
+        future.add_done_callback(lambda f: segments.put(None))
+        return iter(segments.get, None), future
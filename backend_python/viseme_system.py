@@ -1,12 +1,46 @@
 """
 Viseme Mapping System - Chuyển đổi IPA phonemes thành mouth shapes
 """
+import hashlib
 import re
 import random
 import json
+from contextlib import nullcontext
+
+import numpy as np
+
+from animation_format import columnar_keyframes, FLOAT_CHANNELS
+from result_cache import ResultCache, text_key
+
+def trie_pattern(symbols):
+    """Regex alternation shaped like a trie, so the longest symbol always wins"""
+    branches = {}
+    for symbol in symbols:
+        branches.setdefault(symbol[0], set()).add(symbol[1:])
+    
+    singles = []
+    parts = []
+    for char, tails in branches.items():
+        longer = sorted(tail for tail in tails if tail)
+        if not longer:
+            singles.append(char)
+            continue
+        optional = '?' if '' in tails else ''
+        parts.append(f'{re.escape(char)}(?:{trie_pattern(longer)}){optional}')
+    if singles:
+        parts.append('[' + ''.join(re.escape(char) for char in sorted(singles)) + ']')
+    return '|'.join(parts)
 
 class VisemeMapper:
-    def __init__(self):
+    STRESS_MARKS = str.maketrans('', '', 'ˈˌ')
+    
+    def __init__(self, track_cache_size=1024, stage_timer=None):
+        # stage_timer(name) -> context manager đo thời gian từng stage (ví dụ Metrics.stage)
+        self.stage_timer = stage_timer or (lambda name: nullcontext())
+        
+        # Viseme track (đường cong theo thời gian liên tục) cache theo text, dùng lại cho mọi fps
+        self.track_cache = ResultCache(track_cache_size)
+        
         # Mapping IPA phonemes to visemes (mouth shapes)
         self.ipa_to_viseme = {
             # Silence/Rest
@@ -259,61 +293,55 @@ class VisemeMapper:
             },  # "sing"
         }
         
+        # Tokenizer longest-match dựng một lần từ các key của ipa_to_viseme
+        self.phoneme_pattern = self.build_tokenizer()
+        
+        # Ma trận visemes x channels cho coarticulation blending
+        self.viseme_ids = {name: index for index, name in enumerate(self.viseme_params)}
+        self.viseme_matrix = np.array([[params[channel] for channel in FLOAT_CHANNELS]
+                                       for params in self.viseme_params.values()], dtype=np.float64)
+        self.blend_smoothing = 0.05  # Độ rộng box filter (giây) khi blend
+        self.blend_samples = 5
+        
         # Eye blink patterns
         self.blink_probability = 0.05  # 5% chance per frame
         self.blink_duration = 0.15     # Blink lasts 150ms
         
+    def build_tokenizer(self):
+        """Compile one longest-match regex over the keys of ipa_to_viseme.
+        
+        Long vowels are registered with both length marks (':' and 'ː') so either
+        spelling maps to a viseme. Symbols that are not keys fall back to a
+        single character plus an optional length mark.
+        """
+        for key, viseme in list(self.ipa_to_viseme.items()):
+            for variant in (key.replace(':', 'ː'), key.replace('ː', ':')):
+                self.ipa_to_viseme.setdefault(variant, viseme)
+        # 'sil' là marker im lặng, không phải ký hiệu IPA
+        symbols = [key for key in self.ipa_to_viseme if key != 'sil']
+        return re.compile(trie_pattern(symbols) + '|.[ː:]?', re.S)
+    
     def parse_ipa_phonemes(self, ipa_text):
         """Parse IPA text thành individual phonemes"""
         # Remove stress markers
-        clean_ipa = ipa_text.replace('ˈ', '').replace('ˌ', '')
-        
-        # Simple phoneme parsing - split by spaces and common boundaries
-        phonemes = []
-        current_phoneme = ""
-        
-        i = 0
-        while i < len(clean_ipa):
-            char = clean_ipa[i]
-            
-            if char == ' ':
-                if current_phoneme:
-                    phonemes.append(current_phoneme)
-                    current_phoneme = ""
-                phonemes.append(' ')
-            elif char in 'ː':  # Length marker
-                current_phoneme += char
-                phonemes.append(current_phoneme)
-                current_phoneme = ""
-            elif char in 'aeiouɑɛɪɔʊʌɜəɚ':  # Vowels
-                current_phoneme += char
-                # Check for diphthongs
-                if i + 1 < len(clean_ipa) and clean_ipa[i + 1] in 'ɪʊ':
-                    current_phoneme += clean_ipa[i + 1]
-                    i += 1
-                phonemes.append(current_phoneme)
-                current_phoneme = ""
-            else:  # Consonants
-                current_phoneme += char
-                # Check for digraphs
-                if i + 1 < len(clean_ipa):
-                    next_char = clean_ipa[i + 1]
-                    if (char == 't' and next_char == 'ʃ') or \
-                       (char == 'd' and next_char == 'ʒ'):
-                        current_phoneme += next_char
-                        i += 1
-                phonemes.append(current_phoneme)
-                current_phoneme = ""
-            
-            i += 1
-        
-        if current_phoneme:
-            phonemes.append(current_phoneme)
-        
-        return [p for p in phonemes if p]  # Remove empty strings
+        return self.phoneme_pattern.findall(ipa_text.translate(self.STRESS_MARKS))
+    
+    def parse_ipa_batch(self, ipa_texts):
+        """Parse many IPA strings in one call"""
+        findall = self.phoneme_pattern.findall
+        stress = self.STRESS_MARKS
+        return [findall(text.translate(stress)) for text in ipa_texts]
+    
+    def resolve_seed(self, seed, *inputs):
+        """Seed for blink generation: the given seed, or one derived from a hash of the inputs"""
+        if seed is not None:
+            return int(seed)
+        digest = hashlib.sha256(repr(inputs).encode('utf-8')).digest()
+        return int.from_bytes(digest[:6], 'big')  # < 2**53, an toàn cho JSON number trong JS
     
-    def ipa_to_visemes(self, ipa_text, total_duration=3.0):
-        """Convert IPA text to viseme sequence with timing"""
+    def ipa_to_visemes(self, ipa_text, total_duration=3.0, seed=None):
+        """Convert IPA text to viseme sequence with timing, blinks reproducible from seed"""
+        rng = random.Random(self.resolve_seed(seed, ipa_text, total_duration))
         try:
             phonemes = self.parse_ipa_phonemes(ipa_text)
             
@@ -330,28 +358,12 @@ class VisemeMapper:
                 if phoneme.strip():
                     # Map phoneme to viseme
                     viseme = self.ipa_to_viseme.get(phoneme, 'rest')
-                    params = self.viseme_params.get(viseme, self.viseme_params['rest']).copy()
+                    params = self.viseme_params.get(viseme, self.viseme_params['rest'])
                     
                     # Adjust duration based on phoneme type
                     duration = base_duration * params.get('duration', 0.1) / 0.1
                     
-                    # Generate blink timing
-                    should_blink = random.random() < self.blink_probability
-                    
-                    viseme_data = {
-                        'phoneme': phoneme,
-                        'viseme': viseme,
-                        'start_time': current_time,
-                        'end_time': current_time + duration,
-                        'duration': duration,
-                        'mouth_open': params['mouth_open'],
-                        'mouth_width': params['mouth_width'],
-                        'lip_round': params['lip_round'],
-                        'jaw_open': params['jaw_open'],
-                        'blink': should_blink
-                    }
-                    
-                    visemes.append(viseme_data)
+                    visemes.append(self.make_viseme(phoneme, viseme, current_time, duration, rng))
                     current_time += duration
             
             return visemes
@@ -360,59 +372,182 @@ class VisemeMapper:
             print(f"Error in IPA to visemes conversion: {e}")
             return []
     
-    def generate_animation_keyframes(self, visemes, fps=30):
-        """Generate animation keyframes for facial animation"""
-        if not visemes:
-            return []
+    def make_viseme(self, phoneme, viseme, start_time, duration, rng=random):
+        """Build one timed viseme entry with its mouth parameters"""
+        params = self.viseme_params.get(viseme, self.viseme_params['rest'])
+        return {
+            'phoneme': phoneme,
+            'viseme': viseme,
+            'start_time': start_time,
+            'end_time': start_time + duration,
+            'duration': duration,
+            'mouth_open': params['mouth_open'],
+            'mouth_width': params['mouth_width'],
+            'lip_round': params['lip_round'],
+            'jaw_open': params['jaw_open'],
+            # Generate blink timing
+            'blink': rng.random() < self.blink_probability
+        }
+    
+    def align_word_visemes(self, words, seed=None):
+        """Build a viseme track from word-level timestamps.
         
-        keyframes = []
-        total_duration = max(v['end_time'] for v in visemes)
-        total_frames = int(total_duration * fps)
+        ``words`` is a list of dicts with ``start``, ``end`` and ``ipa``. Each
+        word's phonemes are placed inside that word's real time span, weighted by
+        the viseme durations like ``ipa_to_visemes``; gaps between words become
+        'rest' visemes.
+        """
+        rng = random.Random(self.resolve_seed(
+            seed, [(word['ipa'], word['start'], word['end']) for word in words]))
+        visemes = []
+        current_time = 0.0
         
-        for frame_num in range(total_frames):
-            time_point = frame_num / fps
-            
-            # Find current viseme
-            current_viseme = None
-            for viseme in visemes:
-                if viseme['start_time'] <= time_point <= viseme['end_time']:
-                    current_viseme = viseme
-                    break
-            
-            if current_viseme is None:
-                current_viseme = {
-                    'mouth_open': 0.0,
-                    'mouth_width': 0.5,
-                    'lip_round': 0.0,
-                    'jaw_open': 0.0,
-                    'blink': False
-                }
+        word_phonemes = self.parse_ipa_batch([word['ipa'] for word in words])
+        for word, parsed in zip(words, word_phonemes):
+            start, end = word['start'], word['end']
+            if start > current_time:
+                visemes.append(self.make_viseme(' ', 'rest', current_time, start - current_time, rng))
+            start = max(start, current_time)
+            if end <= start:
+                continue
             
-            # Generate smooth transitions
-            progress = 0.5  # Middle of transition
-            if current_viseme:
-                duration = current_viseme['end_time'] - current_viseme['start_time']
-                if duration > 0:
-                    progress = (time_point - current_viseme['start_time']) / duration
+            # Bỏ dấu câu và khoảng trắng
+            phonemes = [phoneme for phoneme in parsed if any(char.isalpha() for char in phoneme)]
+            if not phonemes:
+                visemes.append(self.make_viseme(' ', 'rest', start, end - start, rng))
+                current_time = end
+                continue
             
-            # Apply easing for smooth animation
-            ease_progress = self.ease_in_out(progress)
+            viseme_names = [self.ipa_to_viseme.get(phoneme, 'rest') for phoneme in phonemes]
+            weights = [self.viseme_params.get(viseme, self.viseme_params['rest']).get('duration', 0.1)
+                       for viseme in viseme_names]
+            scale = (end - start) / sum(weights)
             
-            keyframe = {
-                'frame': frame_num,
+            current_time = start
+            for phoneme, viseme, weight in zip(phonemes, viseme_names, weights):
+                duration = weight * scale
+                visemes.append(self.make_viseme(phoneme, viseme, current_time, duration, rng))
+                current_time += duration
+            current_time = end
+        
+        return visemes
+    
+    def total_frames(self, visemes, fps=30):
+        """Number of animation frames covering the viseme track"""
+        return int(max(v['end_time'] for v in visemes) * fps) if visemes else 0
+    
+    def blend_channels(self, visemes, times, lookahead=0.04):
+        """Coarticulated mouth channels at ``times``, shape (frames, channels).
+        
+        Each viseme's target row of ``viseme_matrix`` is placed at its center,
+        shifted ``lookahead`` seconds earlier so the mouth anticipates the next
+        sound, with the rest pose before the first and after the last viseme.
+        Channels are linearly interpolated between neighbouring targets and
+        box-filtered over ``blend_smoothing`` seconds. Every frame is computed
+        independently, so windows of the same track line up exactly.
+        """
+        rest = self.viseme_ids['rest']
+        ids = np.array([self.viseme_ids.get(v.get('viseme', 'rest'), rest) for v in visemes])
+        starts = np.array([v['start_time'] for v in visemes], dtype=np.float64)
+        ends = np.array([v['end_time'] for v in visemes], dtype=np.float64)
+        
+        knots = np.concatenate(([starts[0] - lookahead], (starts + ends) / 2 - lookahead, [ends[-1]]))
+        targets = self.viseme_matrix[np.concatenate(([rest], ids, [rest]))]
+        
+        offsets = np.linspace(-self.blend_smoothing / 2, self.blend_smoothing / 2, self.blend_samples)
+        sample_times = times[:, None] + offsets[None, :]
+        return np.stack([np.interp(sample_times, knots, targets[:, column]).mean(axis=1)
+                         for column in range(targets.shape[1])], axis=1)
+    
+    def keyframe_arrays(self, visemes, fps=30, start_frame=0, stop_frame=None, lookahead=None):
+        """Compute per-frame animation channels as NumPy arrays.
+        
+        Frame -> viseme lookup is a ``searchsorted`` over the viseme end times
+        (the first viseme with ``start_time <= t <= end_time``, as visemes are
+        contiguous and ordered); easing and blink are array operations. Frames
+        not covered by any viseme get index -1 and the rest pose.
+        ``start_frame``/``stop_frame`` compute only a window of the animation.
+        With ``lookahead`` set, mouth channels come from blend_channels instead
+        of easing within a single viseme.
+        """
+        starts = np.array([v['start_time'] for v in visemes], dtype=np.float64)
+        ends = np.array([v['end_time'] for v in visemes], dtype=np.float64)
+        total_frames = self.total_frames(visemes, fps)
+        if stop_frame is not None:
+            total_frames = min(stop_frame, total_frames)
+        
+        frames = np.arange(min(start_frame, total_frames), total_frames)
+        times = frames / fps
+        
+        index = np.searchsorted(ends, times, side='left')
+        index = np.minimum(index, len(visemes) - 1)
+        covered = (starts[index] <= times) & (times <= ends[index])
+        index = np.where(covered, index, -1)
+        
+        # Giá trị của viseme tại mỗi frame, -1 lấy rest pose ở cuối bảng
+        def channel(key, default):
+            values = np.array([v[key] for v in visemes] + [default], dtype=np.float64)
+            return values[index]
+        
+        durations = (ends - starts)[index]
+        progress = np.full(len(frames), 0.5)
+        moving = covered & (durations > 0)
+        progress[moving] = (times[moving] - starts[index[moving]]) / durations[moving]
+        ease = np.where(progress < 0.5, 2 * progress * progress, -1 + (4 - 2 * progress) * progress)
+        
+        blink = np.array([bool(v.get('blink', False)) for v in visemes] + [False])[index]
+        
+        arrays = {
+            'frame': frames,
+            'time': times,
+            'viseme_index': index,
+            'blink': blink & (frames % 10 < 3)  # Blink effect
+        }
+        if lookahead is not None and len(frames):
+            blended = self.blend_channels(visemes, times, lookahead)
+            for column, name in enumerate(FLOAT_CHANNELS):
+                arrays[name] = blended[:, column]
+        else:
+            arrays['mouth_open'] = channel('mouth_open', 0.0) * ease
+            arrays['mouth_width'] = channel('mouth_width', 0.5)
+            arrays['lip_round'] = channel('lip_round', 0.0)
+            arrays['jaw_open'] = channel('jaw_open', 0.0) * ease
+        return arrays
+    
+    def generate_animation_keyframes(self, visemes, fps=30, lookahead=None):
+        """Generate animation keyframes for facial animation (list-of-dicts view of keyframe_arrays)"""
+        if not visemes:
+            return []
+        return self.keyframe_dicts(self.keyframe_arrays(visemes, fps, lookahead=lookahead), visemes)
+    
+    def keyframe_dicts(self, arrays, visemes):
+        """Per-frame dicts from keyframe_arrays output"""
+        phonemes = [v.get('phoneme', '') for v in visemes] + ['']
+        viseme_names = [v.get('viseme', 'rest') for v in visemes] + ['rest']
+        
+        return [
+            {
+                'frame': frame,
                 'time': time_point,
-                'mouth_open': current_viseme['mouth_open'] * ease_progress,
-                'mouth_width': current_viseme['mouth_width'],
-                'lip_round': current_viseme['lip_round'],
-                'jaw_open': current_viseme['jaw_open'] * ease_progress,
-                'blink': current_viseme.get('blink', False) and (frame_num % 10 < 3),  # Blink effect
-                'phoneme': current_viseme.get('phoneme', ''),
-                'viseme': current_viseme.get('viseme', 'rest')
+                'mouth_open': mouth_open,
+                'mouth_width': mouth_width,
+                'lip_round': lip_round,
+                'jaw_open': jaw_open,
+                'blink': blink,
+                'phoneme': phonemes[index],
+                'viseme': viseme_names[index]
             }
-            
-            keyframes.append(keyframe)
-        
-        return keyframes
+            for frame, time_point, mouth_open, mouth_width, lip_round, jaw_open, blink, index in zip(
+                arrays['frame'].tolist(),
+                arrays['time'].tolist(),
+                arrays['mouth_open'].tolist(),
+                arrays['mouth_width'].tolist(),
+                arrays['lip_round'].tolist(),
+                arrays['jaw_open'].tolist(),
+                arrays['blink'].tolist(),
+                arrays['viseme_index'].tolist()
+            )
+        ]
     
     def ease_in_out(self, t):
         """Easing function for smooth animations"""
@@ -421,21 +556,74 @@ class VisemeMapper:
         else:
             return -1 + (4 - 2 * t) * t
     
-    def export_animation_data(self, ipa_text, duration=3.0, fps=30):
-        """Export complete animation data for frontend"""
+    def build_keyframes(self, visemes, fps=30, keyframe_format='frames', lookahead=None, start_frame=0,
+                        stop_frame=None):
+        """Keyframes as per-frame dicts ('frames') or parallel typed arrays ('columnar')"""
+        if not visemes and keyframe_format != 'columnar':
+            return []
+        arrays = self.keyframe_arrays(visemes, fps, start_frame, stop_frame, lookahead)
+        if keyframe_format == 'columnar':
+            return columnar_keyframes(arrays, visemes)
+        return self.keyframe_dicts(arrays, visemes)
+    
+    def iter_keyframe_batches(self, visemes, fps=30, batch_frames=300, keyframe_format='frames', lookahead=None):
+        """Yield (start_frame, keyframes) windows of the animation, one batch_frames window at a time"""
+        total_frames = self.total_frames(visemes, fps)
+        for start_frame in range(0, total_frames, batch_frames):
+            arrays = self.keyframe_arrays(visemes, fps, start_frame, start_frame + batch_frames, lookahead)
+            if keyframe_format == 'columnar':
+                yield start_frame, columnar_keyframes(arrays, visemes)
+            else:
+                yield start_frame, self.keyframe_dicts(arrays, visemes)
+    
+    def viseme_track(self, ipa_text, duration=3.0, seed=None):
+        """Continuous-time viseme track for a text, cached and independent of fps.
+        
+        Returns ``{'ipa_text', 'duration', 'seed', 'visemes'}``; any frame rate
+        or frame window is resampled from it by keyframe_arrays.
+        """
+        seed = self.resolve_seed(seed, ipa_text, duration)
+        key = text_key(ipa_text, float(duration), seed)
+        track = self.track_cache.get(key)
+        if track is None:
+            track = {
+                'ipa_text': ipa_text,
+                'duration': duration,
+                'seed': seed,
+                'visemes': self.ipa_to_visemes(ipa_text, duration, seed)
+            }
+            self.track_cache.put(key, track)
+        return track
+    
+    def export_animation_data(self, ipa_text, duration=3.0, fps=30, keyframe_format='frames', seed=None,
+                              lookahead=None, start_frame=0, stop_frame=None):
+        """Export complete animation data for frontend, blended with coarticulation when lookahead is set.
+        
+        ``start_frame``/``stop_frame`` return only that window of keyframes;
+        ``total_frames`` is always the length of the whole animation.
+        """
         try:
-            # Convert IPA to visemes
-            visemes = self.ipa_to_visemes(ipa_text, duration)
+            # Convert IPA to visemes (cached, shared by every fps)
+            with self.stage_timer('viseme_generation'):
+                track = self.viseme_track(ipa_text, duration, seed)
+            visemes = track['visemes']
             
-            # Generate keyframes
-            keyframes = self.generate_animation_keyframes(visemes, fps)
+            # Resample keyframes at the requested fps / window
+            total_frames = self.total_frames(visemes, fps)
+            stop_frame = total_frames if stop_frame is None else min(stop_frame, total_frames)
+            start_frame = min(start_frame, stop_frame)
+            with self.stage_timer('keyframes'):
+                keyframes = self.build_keyframes(visemes, fps, keyframe_format, lookahead, start_frame, stop_frame)
             
             animation_data = {
                 'success': True,
                 'ipa_text': ipa_text,
                 'duration': duration,
                 'fps': fps,
-                'total_frames': len(keyframes),
+                'seed': track['seed'],
+                'total_frames': total_frames,
+                'start_frame': start_frame,
+                'end_frame': stop_frame,
                 'visemes': visemes,
                 'keyframes': keyframes,
                 'phonemes_count': len([v for v in visemes if v['phoneme'] != ' '])
@@ -450,6 +638,31 @@ class VisemeMapper:
                 'ipa_text': ipa_text
             }
 
+    def export_aligned_animation_data(self, words, fps=30, keyframe_format='frames', seed=None, lookahead=None):
+        """Export animation data from word-aligned IPA (see align_word_visemes)"""
+        try:
+            with self.stage_timer('viseme_generation'):
+                visemes = self.align_word_visemes(words, seed)
+            with self.stage_timer('keyframes'):
+                keyframes = self.build_keyframes(visemes, fps, keyframe_format, lookahead)
+            
+            return {
+                'success': True,
+                'ipa_text': ' '.join(word['ipa'] for word in words),
+                'duration': max((v['end_time'] for v in visemes), default=0.0),
+                'fps': fps,
+                'total_frames': keyframes['total_frames'] if keyframe_format == 'columnar' else len(keyframes),
+                'visemes': visemes,
+                'keyframes': keyframes,
+                'phonemes_count': len([v for v in visemes if v['phoneme'] != ' '])
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
 # Test the system
 if __name__ == "__main__":
     mapper = VisemeMapper()